@@ -0,0 +1,8 @@
+"""
+Benchmarks for pyrocket.
+Each module can be run directly: python -m benchmarks.<module>
+
+- core: Microbenchmarks of track evaluation, editing and file formats with json results and baseline comparison
+- playback: Cursor vs bisect lookups during 60 fps playback
+- network: Socket connector throughput against the local stand-in editor
+"""
@@ -0,0 +1,246 @@
+"""
+Microbenchmarks for the hot paths in pyrocket.
+
+Run the benchmarks and store the results:
+
+    python -m benchmarks.core run --output results.json
+
+Compare results against a baseline and flag regressions:
+
+    python -m benchmarks.core compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+
+from rocket.connectors import ProjectFileConnector
+from rocket.controllers import Controller
+from rocket.tracks import Track, TrackContainer, STEP, LINEAR, SMOOTH, RAMP
+
+KINDS = {'step': STEP, 'linear': LINEAR, 'smooth': SMOOTH, 'ramp': RAMP}
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def measure(func, repeat=5):
+    """Best of several runs in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def create_track(num_keys, spacing, kind=None, name="bench:track"):
+    rnd = random.Random(0)
+    t = Track(name)
+    kinds = [kind if kind is not None else rnd.randint(0, 3) for _ in range(num_keys)]
+    t.set_keys(
+        array('i', range(0, num_keys * spacing, spacing)),
+        array('f', [rnd.uniform(-100.0, 100.0) for _ in range(num_keys)]),
+        array('b', kinds),
+    )
+    return t
+
+
+def write_project(filepath, num_tracks, num_keys):
+    rnd = random.Random(0)
+    with open(filepath, 'w') as fd:
+        fd.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        fd.write('<tracks rows="{0}" startRow="0" endRow="{0}" highlightRowStep="8">\n'.format(num_keys * 4))
+        for n in range(num_tracks):
+            fd.write('\t<track name="bench:track{}" folded="0" color="ffb27474">\n'.format(n))
+            for i in range(num_keys):
+                fd.write('\t\t<key row="{}" value="{:f}" interpolation="{}" />\n'.format(
+                    i * 4, rnd.uniform(-100.0, 100.0), rnd.randint(0, 3)))
+            fd.write('\t</track>\n')
+        fd.write('</tracks>\n')
+
+
+@benchmark
+def row_value(results, scale):
+    """Track.row_value per interpolation kind on sparse and dense tracks"""
+    lookups = 10000 * scale
+    for density, spacing in (('sparse', 64), ('dense', 1)):
+        for kind_name, kind in KINDS.items():
+            t = create_track(5000, spacing, kind=kind)
+            end = t.rows[-1]
+            rows = [i * end / lookups for i in range(lookups)]
+
+            def run():
+                for row in rows:
+                    t.row_value(row)
+
+            results["row_value.{}.{}".format(density, kind_name)] = measure(run) / lookups
+
+
+@benchmark
+def edit(results, scale):
+    """Track.add_or_update, Track.delete and Track.apply_edits at scale"""
+    count = 10000 * scale
+    rnd = random.Random(0)
+    rows = rnd.sample(range(count * 10), count)
+
+    for size in (1000, 100000):
+        def run_add():
+            t = create_track(size, 10)
+            for row in rows:
+                t.add_or_update(row * 10 + 5, 1.0, LINEAR)
+
+        results["add_or_update.{}".format(size)] = measure(run_add, repeat=3) / count
+
+        deletes = rnd.sample(range(size), min(size, count))
+
+        def run_delete():
+            t = create_track(size, 1)
+            for row in deletes:
+                t.delete(row)
+
+        results["delete.{}".format(size)] = measure(run_delete, repeat=3) / len(deletes)
+
+        edits = [(row * 10 + 5, 1.0, LINEAR) for row in rows] + [(row, None, None) for row in deletes]
+
+        def run_batch():
+            t = create_track(size, 1)
+            t.apply_edits(edits)
+
+        results["apply_edits.{}".format(size)] = measure(run_batch, repeat=3) / len(edits)
+
+
+@benchmark
+def track_file(results, scale):
+    """Track.load and Track.save"""
+    path = tempfile.mkdtemp()
+    try:
+        for size in (1000, 100000 * scale):
+            t = create_track(size, 2)
+            results["track_save.{}".format(size)] = measure(lambda: t.save(path))
+            filepath = os.path.join(path, Track.filename(t.name))
+            results["track_load.{}".format(size)] = measure(lambda: Track(t.name).load(filepath))
+    finally:
+        shutil.rmtree(path)
+
+
+@benchmark
+def project_file(results, scale):
+    """ProjectFileConnector parsing of a generated project and loading it from the cache"""
+    path = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(path, 'project.xml')
+        write_project(filepath, 100, 1000 * scale)
+
+        def run():
+            ProjectFileConnector(filepath, controller=Controller(24), tracks=TrackContainer(None))
+
+        results["project_file.100x{}".format(1000 * scale)] = measure(run, repeat=3)
+
+        cache_file = os.path.join(path, 'project.cache')
+        ProjectFileConnector(filepath, controller=Controller(24), tracks=TrackContainer(None), cache_file=cache_file)
+
+        def run_cached():
+            tracks = TrackContainer(None)
+            ProjectFileConnector(filepath, controller=Controller(24), tracks=tracks, cache_file=cache_file)
+            for _ in tracks.loaded_tracks():
+                pass
+
+        results["project_cache.100x{}".format(1000 * scale)] = measure(run_cached, repeat=3)
+    finally:
+        shutil.rmtree(path)
+
+
+@benchmark
+def container_save(results, scale):
+    """TrackContainer.save"""
+    path = tempfile.mkdtemp()
+    try:
+        tracks = TrackContainer(path)
+        for i in range(200):
+            tracks.add(create_track(1000 * scale, 2, name="bench:track{}".format(i)))
+        results["container_save.200x{}".format(1000 * scale)] = measure(lambda: tracks.save(force=True), repeat=3)
+    finally:
+        shutil.rmtree(path)
+
+
+def run(args):
+    selected = [b for b in BENCHMARKS if not args.filter or any(f in b.__name__ for f in args.filter)]
+    results = {}
+    for func in selected:
+        print("Running {}".format(func.__name__), file=sys.stderr)
+        func(results, args.scale)
+
+    data = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'results': results,
+    }
+    for name, value in sorted(results.items()):
+        print("{:40} {:12.3f} us".format(name, value * 1e6))
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(data, fd, indent=2, sort_keys=True)
+
+
+def compare(args):
+    with open(args.baseline) as fd:
+        baseline = json.load(fd)['results']
+    with open(args.results) as fd:
+        results = json.load(fd)['results']
+
+    regressions = 0
+    for name in sorted(set(baseline) & set(results)):
+        change = results[name] / baseline[name] - 1.0
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "improved"
+        print("{:40} {:12.3f} us {:12.3f} us {:+8.1%} {}".format(
+            name, baseline[name] * 1e6, results[name] * 1e6, change, flag))
+
+    for name in sorted(set(baseline) ^ set(results)):
+        print("{:40} only in {}".format(name, "baseline" if name in baseline else "results"))
+
+    if regressions:
+        print("{} regression(s) above {:.0%}".format(regressions, args.threshold))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    run_parser = sub.add_parser('run', help="Run benchmarks")
+    run_parser.add_argument('--output', help="Write results to a json file")
+    run_parser.add_argument('--scale', type=int, default=1, help="Multiply the workload size")
+    run_parser.add_argument('--filter', nargs='*', help="Only run benchmarks with these names")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = sub.add_parser('compare', help="Compare results against a baseline")
+    compare_parser.add_argument('baseline', help="Baseline json file")
+    compare_parser.add_argument('results', help="Results json file")
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="Relative slowdown to flag")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
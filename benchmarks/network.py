@@ -0,0 +1,88 @@
+"""
+Socket connector benchmarks using the local stand-in editor server.
+Measures startup time for registering tracks, applied edits per second
+and update() latency percentiles while the editor pushes edits.
+
+    python -m benchmarks.network
+"""
+import argparse
+import time
+
+from rocket import Rocket
+from rocket.controllers import Controller
+from rocket.server import EditorServer
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def connect(num_tracks, **options):
+    """Connect a client to a new server and register tracks"""
+    server = EditorServer(port=0)
+    port = server.start()
+
+    start = time.perf_counter()
+    rocket = Rocket.from_socket(Controller(24), port=port, **options)
+    for i in range(num_tracks):
+        rocket.track("bench:track{}".format(i))
+    # GET_TRACK commands are sent on the first update
+    rocket.update()
+    server.wait_for_tracks(num_tracks, timeout=30)
+    startup = time.perf_counter() - start
+
+    return server, rocket, startup
+
+
+def key_count(rocket):
+    return sum(len(t.rows) for t in rocket.tracks.track_index)
+
+
+def run(name, num_tracks, num_edits, burst, **options):
+    server, rocket, startup = connect(num_tracks, **options)
+
+    # Unique rows per edit so the number of keys tells us when everything is applied
+    rows_per_track = num_edits // num_tracks
+    timings = []
+    start = time.perf_counter()
+    queued = 0
+    for i in range(num_tracks):
+        server.burst(i, range(rows_per_track))
+        queued += rows_per_track
+        if queued >= burst:
+            server.flush()
+            queued = 0
+    server.flush()
+
+    expected = rows_per_track * num_tracks
+    while key_count(rocket) < expected:
+        t = time.perf_counter()
+        rocket.update()
+        timings.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    server.stop()
+    print("{:>10}: startup {:7.2f} ms | {:9.0f} edits/s | {:6} updates | "
+          "update() p50 {:7.3f} ms p90 {:7.3f} ms p99 {:7.3f} ms max {:7.3f} ms".format(
+              name, startup * 1000, expected / elapsed, len(timings),
+              percentile(timings, 50) * 1000, percentile(timings, 90) * 1000,
+              percentile(timings, 99) * 1000, max(timings) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=200, help="Number of tracks")
+    parser.add_argument('--edits', type=int, default=200000, help="Number of key edits")
+    parser.add_argument('--burst', type=int, default=10000, help="Edits sent per flush from the server")
+    parser.add_argument('--max-edits', type=int, default=5000, help="max_edits_per_frame in capped threaded mode")
+    args = parser.parse_args()
+
+    print("{} tracks, {} edits".format(args.tracks, args.edits))
+    run("polling", args.tracks, args.edits, args.burst)
+    run("threaded", args.tracks, args.edits, args.burst, threaded=True)
+    run("capped", args.tracks, args.edits, args.burst, threaded=True, max_edits_per_frame=args.max_edits)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare cursor based and bisect based track lookups
+for 60 fps playback over dense tracks.
+
+    python -m benchmarks.playback
+"""
+import argparse
+import random
+import time
+
+from rocket.tracks import Track
+
+
+def create_tracks(num_tracks, num_keys, spacing):
+    random.seed(0)
+    tracks = []
+    for n in range(num_tracks):
+        t = Track("bench:track{}".format(n))
+        for i in range(num_keys):
+            t.add_or_update(i * spacing, random.uniform(-100.0, 100.0), random.randint(0, 3))
+        tracks.append(t)
+    return tracks
+
+
+def playback(tracks, rows):
+    start = time.perf_counter()
+    for row in rows:
+        for t in tracks:
+            t.row_value(row)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=100, help="Number of tracks")
+    parser.add_argument('--keys', type=int, default=10000, help="Keys per track")
+    parser.add_argument('--spacing', type=int, default=2, help="Rows between keys")
+    parser.add_argument('--rps', type=float, default=24.0, help="Rows per second")
+    parser.add_argument('--fps', type=float, default=60.0, help="Frames per second")
+    parser.add_argument('--seconds', type=float, default=60.0, help="Playback duration")
+    args = parser.parse_args()
+
+    tracks = create_tracks(args.tracks, args.keys, args.spacing)
+    frames = int(args.seconds * args.fps)
+    rows = [frame * args.rps / args.fps for frame in range(frames)]
+    lookups = frames * len(tracks)
+
+    print("{} tracks x {} keys, {} frames at {} fps ({} lookups)".format(
+        args.tracks, args.keys, frames, args.fps, lookups))
+
+    results = {}
+    for name, use_cursor in (("bisect", False), ("cursor", True)):
+        for t in tracks:
+            t.use_cursor = use_cursor
+            t._cursor = -1
+        results[name] = playback(tracks, rows)
+        print("{:>8}: {:.3f}s  {:.0f} ns/lookup".format(name, results[name], results[name] / lookups * 1e9))
+
+    print(" speedup: {:.2f}x".format(results["bisect"] / results["cursor"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Single file track bundle.
+All tracks are stored in one file with an index in the header
+so individual tracks can be decoded on demand from a memory map.
+
+Layout (all little endian):
+
+    4 bytes: magic 'RKTB'
+    uint32: version
+    uint32: number of tracks
+    for number of tracks
+        uint16: length of name
+        bytes: utf-8 track name
+        uint32: number of keys
+        uint64: offset of key data
+    for number of tracks (each block 4 byte aligned)
+        int32 * keys: rows
+        float32 * keys: values
+        int8 * keys: interpolation types
+"""
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'RKTB'
+VERSION = 1
+
+HEADER = struct.Struct('<4sII')
+ENTRY_NAME = struct.Struct('<H')
+ENTRY = struct.Struct('<IQ')
+
+
+def _align(value):
+    return (value + 3) & ~3
+
+
+def block_size(count):
+    """Size of the key data for a track"""
+    return _align(count * 9)
+
+
+def write_bundle(tracks, filepath, trailer=b''):
+    """
+    Write tracks to a bundle file
+    :param tracks: List of tracks
+    :param filepath: Path to the bundle file
+    :param trailer: Optional data stored after the key data
+    """
+    tmp = "{}.tmp".format(filepath)
+    with open(tmp, 'wb') as fd:
+        for data in encode(tracks):
+            fd.write(data)
+        fd.write(trailer)
+    os.replace(tmp, filepath)
+
+
+def encode(tracks):
+    """
+    Encode tracks into bundle format
+    :param tracks: List of tracks
+    :return: Generator of byte chunks
+    """
+    names = [t.name.encode() for t in tracks]
+    offset = _align(HEADER.size + sum(ENTRY_NAME.size + len(n) + ENTRY.size for n in names))
+
+    header = [HEADER.pack(MAGIC, VERSION, len(tracks))]
+    for name, t in zip(names, tracks):
+        header.append(ENTRY_NAME.pack(len(name)))
+        header.append(name)
+        header.append(ENTRY.pack(len(t.rows), offset))
+        offset += block_size(len(t.rows))
+
+    header = b''.join(header)
+    yield header + bytes(_align(len(header)) - len(header))
+
+    for t in tracks:
+        count = len(t.rows)
+        for data in (array('i', t.rows), array('f', t.values)):
+            if sys.byteorder == 'big':
+                data.byteswap()
+            yield data.tobytes()
+        yield array('b', t.kinds).tobytes() + bytes(block_size(count) - count * 9)
+
+
+class Bundle:
+    """Index into bundle data from a buffer or memory mapped file"""
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.index = {}
+
+        if len(buffer) < HEADER.size:
+            raise ValueError("Not a track bundle")
+        magic, version, num_tracks = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a track bundle")
+        if version != VERSION:
+            raise ValueError("Unsupported track bundle version: {}".format(version))
+
+        pos = HEADER.size
+        for _ in range(num_tracks):
+            length = ENTRY_NAME.unpack_from(buffer, pos)[0]
+            pos += ENTRY_NAME.size
+            name = bytes(buffer[pos:pos + length]).decode()
+            pos += length
+            count, offset = ENTRY.unpack_from(buffer, pos)
+            pos += ENTRY.size
+            if offset + count * 9 > len(buffer):
+                raise ValueError("Truncated track bundle: '{}' is out of bounds".format(name))
+            self.index[name] = (count, offset)
+
+    @classmethod
+    def open(cls, filepath):
+        """Memory map a bundle file"""
+        with open(filepath, 'rb') as fd:
+            return cls(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def names(self):
+        return list(self.index.keys())
+
+    def read(self, name):
+        """
+        Decode the keys of a track
+        :return: Tuple with rows, values and kinds arrays
+        """
+        count, offset = self.index[name]
+        # frombytes decodes mmap slices (bytes) and memoryview slices the same way
+        rows, values, kinds = array('i'), array('f'), array('b')
+        rows.frombytes(self.buffer[offset:offset + count * 4])
+        values.frombytes(self.buffer[offset + count * 4:offset + count * 8])
+        kinds.frombytes(self.buffer[offset + count * 8:offset + count * 9])
+        if sys.byteorder == 'big':
+            rows.byteswap()
+            values.byteswap()
+        return rows, values, kinds
+
+    def view(self, name):
+        """
+        Zero copy views of the keys of a track.
+        The views are read only and keep the buffer alive until released.
+        On big endian machines the keys are decoded instead.
+        :return: Tuple with rows, values and kinds memoryviews
+        """
+        if sys.byteorder == 'big':
+            return self.read(name)
+
+        count, offset = self.index[name]
+        data = memoryview(self.buffer).toreadonly()
+        return (
+            data[offset:offset + count * 4].cast('i'),
+            data[offset + count * 4:offset + count * 8].cast('f'),
+            data[offset + count * 8:offset + count * 9].cast('b'),
+        )
+
+    def load(self, track):
+        """Fill in the keys of a track"""
+        track.set_keys(*self.read(track.name))
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
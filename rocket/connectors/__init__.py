@@ -1,4 +1,33 @@
-from .base import Connector  # noqa
-from .socket import SocketConnector, SocketConnError  # noqa
-from .project import ProjectFileConnector  # noqa
-from .files import FilesConnector  # noqa
+"""
+Connectors are imported on first use so playback builds don't pay
+for importing the xml parser, sockets or asyncio when they are not used.
+This relies on module level __getattr__ (PEP 562, python 3.7).
+"""
+import importlib
+
+_connectors = {
+    'Connector': '.base',
+    'SocketConnector': '.socket',
+    'SocketConnError': '.socket',
+    'AsyncSocketConnector': '.async_socket',
+    'ProjectFileConnector': '.project',
+    'FilesConnector': '.files',
+    'BundleConnector': '.bundle',
+    'SharedMemoryConnector': '.shared',
+}
+
+__all__ = list(_connectors)
+
+
+def __getattr__(name):
+    module = _connectors.get(name)
+    if module is None:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
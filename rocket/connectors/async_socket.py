@@ -0,0 +1,130 @@
+"""
+Connector talking to the rocket editor/server using asyncio streams.
+"""
+import asyncio
+import logging
+import socket
+from .socket import (
+    SocketConnector, SocketConnError, BinaryWriter, decode_commands,
+    CLIENT_GREET, SERVER_GREET,
+)
+
+logger = logging.getLogger("rocket")
+
+
+class AsyncSocketConnector(SocketConnector):
+    """
+    Connection to the rocket editor/server running on an asyncio event loop.
+    Incoming commands are applied to the tracks by a receive task as soon as they arrive.
+    Outgoing commands are queued and written in update().
+    """
+    def __init__(self, host=None, port=None, controller=None, tracks=None, recv_size=1024 * 1024, journal=None):
+        logger.info("Initializing async socket connector")
+        self.init_state(host, port, controller, tracks, journal=journal)
+        self.recv_size = recv_size
+        self.writer = AsyncBinaryWriter(None)
+
+        self.task = None
+        self.connected = asyncio.Event()
+        self.data_ready = asyncio.Event()
+
+    async def connect(self):
+        """Connect and greet the server, then start receiving commands"""
+        logger.info("Attempting to connect to %s:%s", self.host, self.port)
+        self.reader, stream_writer = await asyncio.open_connection(self.host, self.port)
+        stream_writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        logger.info("Connected to rocket server.")
+
+        logger.info("Greeting server with: %s", CLIENT_GREET)
+        stream_writer.write(CLIENT_GREET.encode())
+        try:
+            greet = await self.reader.readexactly(len(SERVER_GREET))
+        except asyncio.IncompleteReadError as e:
+            raise SocketConnError("Connection closed during greeting: {}".format(e))
+
+        data = greet.decode()
+        logger.info("Server responded with: %s", data)
+
+        if data != SERVER_GREET:
+            raise ValueError("Invalid server response: {}".format(data))
+
+        # Send commands queued before we were connected
+        self.writer.stream = stream_writer
+        self.writer.flush()
+        await stream_writer.drain()
+
+        self.task = asyncio.ensure_future(self.receive())
+        self.connected.set()
+
+    async def receive(self):
+        """Read and apply incoming commands until the connection is closed"""
+        buffer = bytearray()
+        try:
+            while True:
+                data = await self.reader.read(self.recv_size)
+                if not data:
+                    raise SocketConnError("Connection closed by server")
+
+                buffer += data
+                commands, consumed = decode_commands(buffer)
+                del buffer[:consumed]
+                self.apply_commands(commands)
+                if self.journal:
+                    self.journal.flush()
+
+                if commands:
+                    self.data_ready.set()
+        except SocketConnError as e:
+            self.error = e
+        except (ConnectionError, OSError) as e:
+            self.error = SocketConnError("Connection lost: {}".format(e))
+        finally:
+            # Wake up anyone waiting so they can see the error
+            self.data_ready.set()
+
+    async def wait_connected(self):
+        await self.connected.wait()
+
+    async def wait_for_data(self):
+        """Wait until new commands from the server have been applied"""
+        await self.data_ready.wait()
+        self.data_ready.clear()
+        self.check_error()
+
+    async def drain(self):
+        """Flush queued commands and wait for the transport buffer to drain"""
+        self.update()
+        if self.writer.stream:
+            await self.writer.stream.drain()
+
+    def check_error(self):
+        if self.error:
+            raise self.error
+
+    def update(self):
+        """Write queued outgoing commands. Incoming commands are applied by the receive task."""
+        self.check_error()
+        self.writer.flush()
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.writer.stream:
+            self.writer.stream.close()
+
+
+class AsyncBinaryWriter(BinaryWriter):
+    """Buffered writer for asyncio streams"""
+    def __init__(self, stream):
+        super().__init__(None)
+        self.stream = stream
+
+    def flush(self):
+        """Hand queued data to the stream. Data is kept until we are connected."""
+        if self.stream is None or not self.buffer:
+            return 0
+
+        total = len(self.buffer)
+        self.stream.write(bytes(self.buffer))
+        del self.buffer[:]
+        return total
@@ -0,0 +1,30 @@
+"""
+Connector reading tracks from a single bundle file.
+"""
+import logging
+from .base import Connector
+from rocket.bundle import Bundle
+
+logger = logging.getLogger("rocket")
+
+
+class BundleConnector(Connector):
+    """Memory maps a track bundle and decodes tracks the first time they are requested"""
+    def __init__(self, bundle_file, controller=None, tracks=None):
+        """
+        Open a track bundle
+        :param bundle_file: Path to the bundle file
+        :param controller: The controller
+        :param tracks: Track container
+        """
+        logger.info("Initializing bundle connector")
+        self.controller = controller
+        self.tracks = tracks
+        self.controller.connector = self
+        self.tracks.connector = self
+
+        logger.info("Attempting to load '%s'", bundle_file)
+        self.bundle = Bundle.open(bundle_file)
+
+        for name in self.bundle.names():
+            self.tracks.register(name, self.bundle.load)
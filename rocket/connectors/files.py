@@ -4,25 +4,39 @@ Each track is a separate file.
 """
 import logging
 import os
+import time
 from .base import Connector
-from rocket.tracks import Track
+from rocket.tracks import Track, decode_keys
 
 logger = logging.getLogger("rocket")
 
 
 class FilesConnector(Connector):
     """Loads individual track files in a specific path"""
-    def __init__(self, track_path, controller=None, tracks=None):
+    def __init__(self, track_path, controller=None, tracks=None, baked=False, threads=None, lazy=False,
+                 watch=False, watch_interval=0.5):
         """
         Load binary track files
         :param path: Path to track directory
         :param controller: The controller
         :param tracks: Track container
+        :param baked: Also load baked lookup tables (.bake) when present
+        :param threads: Load files concurrently using this many threads
+        :param lazy: Only register tracks and read each file the first time the track is requested
+        :param watch: Reload changed track files in update()
+        :param watch_interval: Minimum number of seconds between checking the files for changes
         """
         logger.info("Initialize loading binary track data")
         self.controller = controller
         self.tracks = tracks
         self.path = track_path
+        self.baked = baked
+
+        self.watch = watch
+        self.watch_interval = watch_interval
+        self.next_check = 0
+        # Modification time and size of the track files when last read
+        self.stamps = {}
 
         self.controller.connector = self
         self.tracks.connector = self
@@ -33,10 +47,99 @@ class FilesConnector(Connector):
             raise ValueError("Track directory do not exist: {}".format(self.path))
 
         logger.info("Looking for track files in '%s'", self.path)
-        for f in os.listdir(self.path):
-            if not f.endswith(".track"):
+        start = time.perf_counter()
+        if self.watch:
+            # Before loading so changes made while loading are picked up
+            self.stamps = self.scan()
+        names = [Track.trackname(f) for f in os.listdir(self.path) if f.endswith(".track")]
+
+        if lazy:
+            for name in names:
+                self.tracks.register(name, self.load_track)
+            logger.info("Registered %s tracks", len(names))
+            return
+
+        tracks = [self.tracks.get_or_create(name) for name in names]
+        if threads:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                # Consume the results to raise exceptions from the workers
+                list(executor.map(self.load_track, tracks))
+        else:
+            for t in tracks:
+                self.load_track(t)
+
+        logger.info("Loaded %s tracks in %.2f ms", len(tracks), (time.perf_counter() - start) * 1000)
+
+    def load_track(self, track):
+        """Load the track file and the optional baked table for a track"""
+        start = time.perf_counter()
+        logger.info("Attempting to load '%s'", track.name)
+        track.load(os.path.join(self.path, Track.filename(track.name)))
+
+        bake_file = os.path.join(self.path, Track.baked_filename(track.name))
+        if self.baked and os.path.exists(bake_file):
+            logger.info("Loading baked table for '%s'", track.name)
+            # Outdated tables (the track was exported again) are ignored
+            track.load_baked(bake_file)
+
+        logger.info("Loaded '%s' (%s keys) in %.2f ms",
+                    track.name, len(track.rows), (time.perf_counter() - start) * 1000)
+
+    def update(self):
+        """Reload changed track files when watching"""
+        if not self.watch:
+            return
+
+        now = time.perf_counter()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.watch_interval
+        self.reload_changed()
+
+    def scan(self):
+        """Modification time and size of each track file"""
+        stamps = {}
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".track"):
+                stat = entry.stat()
+                stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def reload_changed(self):
+        """
+        Read track files changed since they were loaded and swap in the keys of tracks that differ.
+        The track objects are kept so references held by the application stay valid.
+        Reloaded tracks drop their baked table.
+        """
+        stamps = self.scan()
+        for filename, stamp in stamps.items():
+            if self.stamps.get(filename) == stamp:
+                continue
+
+            name = Track.trackname(filename)
+            track = self.tracks.tracks.get(name)
+            if track is not None and track.loader is not None:
+                # Not loaded yet. The loader will read the new file.
+                continue
+
+            filepath = os.path.join(self.path, filename)
+            try:
+                with open(filepath, 'rb') as fd:
+                    keys = decode_keys(fd.read(), filepath)
+            except (OSError, ValueError) as e:
+                # Probably still being written. Try again on the next check.
+                logger.warning("Failed to reload '%s': %s", filepath, e)
+                stamps[filename] = self.stamps.get(filename)
+                continue
+
+            if track is None:
+                track = self.tracks.get_or_create(name)
+            elif (track.rows, track.values, track.kinds) == keys:
                 continue
-            name = Track.trackname(f)
-            logger.info("Attempting to load ''", name)
-            t = self.tracks.get_or_create(name)
-            t.load(os.path.join(self.path, f))
+
+            logger.info("Reloaded '%s' (%s keys)", name, len(keys[0]))
+            track.set_keys(*keys)
+            track.dirty = False
+
+        self.stamps = stamps
@@ -1,38 +1,309 @@
 """
 Connector reading tracks from the track editor xml file.
+
+Parsed projects can be cached in a track bundle with the project
+attributes and the identity of the xml file stored after the key data:
+
+    json: path, size, mtime, sha1 and attributes of the <tracks> node
+    uint32: length of the json data
+    4 bytes: magic 'RKTC'
 """
+from array import array
+import hashlib
+import json
 import logging
-import re
+import os
+import struct
+import time
 from xml.etree import ElementTree
 from .base import Connector
+from rocket import bundle
+from rocket.bundle import Bundle
+from rocket.tracks import sort_keys
 
 logger = logging.getLogger("rocket")
 
+CACHE_MAGIC = b'RKTC'
+CACHE_VERSION = 1
+CACHE_TRAILER = struct.Struct('<I4s')
+
 
 class ProjectFileConnector(Connector):
     """Reads editor project xml file"""
-    def __init__(self, project_file, controller=None, tracks=None):
+    def __init__(self, project_file, controller=None, tracks=None, cache_file=None, watch=False, watch_interval=0.5):
+        """
+        Load a project file
+        :param project_file: Path to the editor xml file
+        :param controller: The controller
+        :param tracks: Track container
+        :param cache_file: Optional cache of the parsed project. Used when the xml file is unchanged.
+        :param watch: Reload the project file in update() when it changes
+        :param watch_interval: Minimum number of seconds between checking the file for changes
+        """
         logger.info("Initializing project file loader")
         self.controller = controller
         self.tracks = tracks
         self.controller.connector = self
         self.tracks.connector = self
 
+        # Attributes of the <tracks> node
+        self.rows = None
+        self.start_row = None
+        self.end_row = None
+        self.highlight_row_step = None
+
+        self.project_file = project_file
+        # Memory mapped cache the tracks are loaded from
+        self.cache_file = cache_file
+        self.cache = None
+
+        self.watch = watch
+        self.watch_interval = watch_interval
+        self.next_check = 0
+
         logger.info("Attempting to load '%s'", project_file)
+        # Before loading so changes made while loading are picked up
+        stat = os.stat(project_file)
+        # Modification time and size of the project file when last read
+        self.stamp = (stat.st_mtime_ns, stat.st_size)
+
+        if cache_file and self.load_cache(project_file, cache_file):
+            return
+
+        reader = ProjectReader(project_file)
+        parsed = []
+        for name, rows, values, kinds in reader:
+            t = self.tracks.get_or_create(name)
+            self.merge_keys(t, rows, values, kinds)
+            parsed.append(t)
+
+        self.set_attributes(reader.attrib)
+
+        if cache_file:
+            self.update_cache(parsed, reader, stat)
+
+    def update(self):
+        """Reload the project file if it changed when watching"""
+        if not self.watch:
+            return
+
+        now = time.perf_counter()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.watch_interval
+
+        try:
+            stat = os.stat(self.project_file)
+        except OSError:
+            # Being replaced by the editor. Try again on the next check.
+            return
+        if (stat.st_mtime_ns, stat.st_size) != self.stamp:
+            self.reload(stat)
+
+    def reload(self, stat):
+        """
+        Parse the project file again and swap in the keys of tracks that changed.
+        The track objects are kept so references held by the application stay valid.
+        Tracks removed from the project keep their keys.
+        """
+        reader = ProjectReader(self.project_file)
+        try:
+            parsed = [(name, sort_keys(rows, values, kinds)) for name, rows, values, kinds in reader]
+        except (OSError, ElementTree.ParseError) as e:
+            # Probably still being written. Try again on the next check.
+            logger.warning("Failed to reload '%s': %s", self.project_file, e)
+            return
+
+        self.stamp = (stat.st_mtime_ns, stat.st_size)
+        tracks = []
+        for name, keys in parsed:
+            t = self.tracks.tracks.get(name)
+            if t is None:
+                t = self.tracks.get_or_create(name)
+            elif t.loader is not None:
+                # Never loaded from the cache, so there is nothing to compare with
+                t.loader = None
+            elif (t.rows, t.values, t.kinds) == keys:
+                tracks.append(t)
+                continue
+
+            logger.info("Reloaded '%s' (%s keys)", name, len(keys[0]))
+            t.set_keys(*keys)
+            tracks.append(t)
+
+        self.set_attributes(reader.attrib)
+
+        if self.cache_file:
+            self.update_cache(tracks, reader, stat)
+
+    def update_cache(self, tracks, reader, stat):
+        """Write parsed tracks to the cache along with the identity of the project file"""
+        info = file_info(self.project_file, stat)
+        info['sha1'] = reader.digest.hexdigest()
+        info['attrib'] = reader.attrib
+        self.write_cache(self.cache_file, tracks, info)
+
+    def set_attributes(self, attrib):
+        """Set attributes of the <tracks> node"""
+        def get_int(name):
+            value = attrib.get(name)
+            return int(value) if value is not None else None
+
+        self.rows = get_int('rows')
+        self.start_row = get_int('startRow')
+        self.end_row = get_int('endRow')
+        self.highlight_row_step = get_int('highlightRowStep')
+
+    @staticmethod
+    def merge_keys(track, rows, values, kinds):
+        if len(track.rows) > 0:
+            # Merge with keys already in the track. New keys take precedence.
+            rows = track.rows + rows
+            values = track.values + values
+            kinds = track.kinds + kinds
+        track.set_keys(*sort_keys(rows, values, kinds))
+
+    def load_cache(self, project_file, cache_file):
+        """
+        Register the tracks in the cache if it was written for the current project file.
+        Keys are decoded from the memory mapped cache when tracks are first requested.
+        :return: True if the cache was used
+        """
+        try:
+            cache = Bundle.open(cache_file)
+        except (OSError, ValueError, struct.error) as e:
+            logger.info("No usable project cache '%s': %s", cache_file, e)
+            return False
+
+        info = read_cache_info(cache.buffer)
+        current = file_info(project_file)
+        if info is None or any(info.get(key) != value for key, value in current.items()) \
+                or info.get('sha1') != file_digest(project_file):
+            logger.info("Project cache '%s' is outdated", cache_file)
+            cache.close()
+            return False
+
+        logger.info("Loading tracks from project cache '%s'", cache_file)
+        self.cache = cache
+        for name in cache.names():
+            t = self.tracks.tracks.get(name)
+            if t is not None and len(t.rows) > 0:
+                self.merge_keys(t, *cache.read(name))
+            else:
+                self.tracks.register(name, cache.load)
+
+        self.set_attributes(info['attrib'])
+        return True
+
+    @staticmethod
+    def write_cache(cache_file, tracks, info):
+        """Write parsed tracks and the project file info to the cache"""
+        data = json.dumps(info).encode()
+        try:
+            bundle.write_bundle(tracks, cache_file, trailer=data + CACHE_TRAILER.pack(len(data), CACHE_MAGIC))
+        except OSError as e:
+            logger.warning("Failed to write project cache '%s': %s", cache_file, e)
+
+
+def file_info(filepath, stat=None):
+    """Identity of a project file used to validate the cache"""
+    stat = stat or os.stat(filepath)
+    return {
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(filepath),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+    }
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as fd:
+        for data in iter(lambda: fd.read(chunk_size), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def read_cache_info(buffer):
+    """
+    Read the project file info stored after the key data of a cache
+    :return: dict or None if the buffer has no info
+    """
+    if len(buffer) < CACHE_TRAILER.size:
+        return None
+    length, magic = CACHE_TRAILER.unpack_from(buffer, len(buffer) - CACHE_TRAILER.size)
+    end = len(buffer) - CACHE_TRAILER.size
+    if magic != CACHE_MAGIC or length > end:
+        return None
+    try:
+        return json.loads(bytes(buffer[end - length:end]).decode())
+    except ValueError:
+        return None
+
+
+class ProjectReader:
+    """
+    Streaming reader for editor project files.
+    Elements are removed from the tree as soon as they are processed, so memory
+    use is bounded by the key arrays of the largest track rather than the file size.
+    Iterating yields (name, rows, values, kinds) for each track.
+    Keys are in file order and may be unsorted.
+    """
+    def __init__(self, project_file, chunk_size=1024 * 1024):
+        self.project_file = project_file
+        self.chunk_size = chunk_size
+        # Attributes of the <tracks> node
+        self.attrib = {}
+        # Hash of the file content read so far
+        self.digest = hashlib.sha1()
+
+    def __iter__(self):
+        parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        rows, values, kinds = array('i'), array('f'), array('b')
+        # Open elements. Finished elements are removed from their parent.
+        stack = []
+
+        for chunk in self._chunks():
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    stack.append(elem)
+                    continue
+
+                stack.pop()
+                tag = elem.tag
+                if tag == 'key':
+                    attrib = elem.attrib
+                    rows.append(int(attrib['row']))
+                    values.append(float(attrib['value']))
+                    kinds.append(int(attrib['interpolation']))
+                elif tag == 'track':
+                    yield elem.attrib['name'], rows, values, kinds
+                    rows, values, kinds = array('i'), array('f'), array('b')
+                elif tag == 'tracks':
+                    self.attrib = dict(elem.attrib)
+
+                if stack:
+                    stack[-1].remove(elem)
+
+        parser.close()
+
+    def _chunks(self):
+        """Read the file in chunks wrapping the content in a root node as the file can have several"""
+        with open(self.project_file, 'rb') as fd:
+            data = fd.read(self.chunk_size)
+            self.digest.update(data)
+            # The root node has to come after the xml declaration
+            prolog = 0
+            if data.lstrip().startswith(b'<?xml'):
+                prolog = data.index(b'?>') + 2
+            yield data[:prolog] + b'<root>' + data[prolog:]
+
+            while True:
+                data = fd.read(self.chunk_size)
+                if not data:
+                    break
+                self.digest.update(data)
+                yield data
 
-        with open(project_file, 'r') as fd:
-            xml = fd.read()
-        # Hack in a root node as ET expects only one root node
-        root = ElementTree.fromstring(re.sub(r"(<\?xml[^>]+\?>)", r"\1<root>", xml) + "</root>")
-
-        # TODO: Consider using root attributes
-        # root.attrib {'rows': '10000', 'startRow': '0', 'endRow': '10000', 'highlightRowStep': '8'}
-
-        for track in root.iter('track'):
-            t = self.tracks.get_or_create(track.attrib['name'])
-            for key in track:
-                t.add_or_update(
-                    int(key.attrib['row']),
-                    float(key.attrib['value']),
-                    int(key.attrib['interpolation']))
-            self.tracks.add(t)
+        yield b'</root>'
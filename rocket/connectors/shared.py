@@ -0,0 +1,33 @@
+"""
+Connector reading tracks from a shared memory block published by another process.
+"""
+import logging
+from .base import Connector
+from rocket.shared import SharedTracks
+
+logger = logging.getLogger("rocket")
+
+
+class SharedMemoryConnector(Connector):
+    """Attaches to a shared track store and points tracks at the shared keys the first time they are requested"""
+    def __init__(self, name, controller=None, tracks=None):
+        """
+        Attach to a shared track store
+        :param name: Name of the shared memory block
+        :param controller: The controller
+        :param tracks: Track container
+        """
+        logger.info("Initializing shared memory connector")
+        self.controller = controller
+        self.tracks = tracks
+        self.controller.connector = self
+        self.tracks.connector = self
+
+        logger.info("Attaching to shared memory '%s'", name)
+        self.store = SharedTracks.attach(name)
+
+        for name in self.store.names():
+            self.tracks.register(name, self.store.load)
+
+    def close(self):
+        self.store.close()
@@ -1,7 +1,8 @@
+import collections
 import logging
 import socket
-import select
 import struct
+import threading
 from .base import Connector
 
 logger = logging.getLogger("rocket")
@@ -18,6 +19,24 @@ SET_ROW = 3
 PAUSE = 4
 SAVE_TRACKS = 5
 
+COMMAND_NAMES = {
+    SET_KEY: 'SET_KEY',
+    DELETE_KEY: 'DELETE_KEY',
+    GET_TRACK: 'GET_TRACK',
+    SET_ROW: 'SET_ROW',
+    PAUSE: 'PAUSE',
+    SAVE_TRACKS: 'SAVE_TRACKS',
+}
+
+# Argument layout following the command byte
+COMMAND_FORMATS = {
+    SET_KEY: struct.Struct('>IIfB'),
+    DELETE_KEY: struct.Struct('>II'),
+    SET_ROW: struct.Struct('>I'),
+    PAUSE: struct.Struct('>B'),
+    SAVE_TRACKS: struct.Struct('>'),
+}
+
 
 class SocketConnError(Exception):
     """Custom exception for detecting connection drop"""
@@ -25,9 +44,33 @@ class SocketConnError(Exception):
 
 
 class SocketConnector(Connector):
-    """Connection to the rocket editor/server"""
-    def __init__(self, host=None, port=None, controller=None, tracks=None):
+    """
+    Connection to the rocket editor/server.
+    In threaded mode a receiver thread owns the socket reads and queues decoded
+    commands. update() then applies the queued commands on the calling thread,
+    optionally limited to max_edits_per_frame commands per call.
+    """
+    # Optional journal recording applied edits
+    journal = None
+
+    def __init__(self, host=None, port=None, controller=None, tracks=None, threaded=False, max_edits_per_frame=None,
+                 journal=None):
         logger.info("Initializing socket connector")
+        self.init_state(host, port, controller, tracks, max_edits_per_frame=max_edits_per_frame, journal=journal)
+        self.socket = None
+
+        self.init_socket()
+        self.greet_server()
+
+        if threaded:
+            self.thread = threading.Thread(target=self.receive, name="rocket-socket", daemon=True)
+            self.thread.start()
+        else:
+            # Incoming commands are polled without blocking
+            self.socket.setblocking(False)
+
+    def init_state(self, host, port, controller, tracks, max_edits_per_frame=None, journal=None):
+        """Set up the state shared by all socket connectors"""
         self.controller = controller
         self.tracks = tracks
         self.controller.connector = self
@@ -36,17 +79,24 @@ class SocketConnector(Connector):
         self.host = host or "127.0.0.1"
         self.port = port or SYNC_DEFAULT_PORT
 
-        self.socket = None
         self.reader = None
         self.writer = None
+        # Last integer row sent to the server
+        self.row = None
 
-        self.init_socket()
-        self.greet_server()
+        self.max_edits_per_frame = max_edits_per_frame
+        self.journal = journal
+        self.thread = None
+        self.lock = threading.Lock()
+        self.queue = collections.deque()
+        self.error = None
 
     def init_socket(self):
         logger.info("Attempting to connect to %s:%s", self.host, self.port)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setblocking(True)
+        # Commands are already batched per frame, so don't delay them further
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.socket.connect((self.host, self.port))
 
         logger.info("Connected to rocket server.")
@@ -56,7 +106,8 @@ class SocketConnector(Connector):
     def greet_server(self):
         logger.info("Greeting server with: %s", CLIENT_GREET)
         self.writer.string(CLIENT_GREET)
-        greet = self.reader.bytes(len(SERVER_GREET), blocking=True)
+        self.writer.flush()
+        greet = self.reader.bytes(len(SERVER_GREET))
 
         data = greet.decode()
         logger.info("Server responded with: %s", data)
@@ -70,13 +121,58 @@ class SocketConnector(Connector):
         self.writer.string(name)
 
     def update(self):
-        """Process all queued incoming commands"""
-        while self.read_command():
-            pass
+        """Send queued outgoing commands and process all queued incoming commands"""
+        try:
+            self.writer.flush()
+        except SocketConnError as e:
+            if not self.thread:
+                raise
+            # Reported by apply_queued once all received commands are applied
+            self.error = self.error or e
+
+        if self.thread:
+            self.apply_queued()
+        else:
+            self.reader.fill()
+            self.apply_commands(self.reader.commands())
+
+        if self.journal:
+            self.journal.flush()
+
+    def receive(self):
+        """Receiver thread reading and decoding commands into the queue"""
+        try:
+            while True:
+                self.reader.recv()
+                commands = self.reader.commands()
+                if commands:
+                    with self.lock:
+                        self.queue.extend(commands)
+        except SocketConnError as e:
+            self.error = e
+
+    def apply_queued(self):
+        """Apply commands queued by the receiver thread"""
+        with self.lock:
+            if self.max_edits_per_frame is None or len(self.queue) <= self.max_edits_per_frame:
+                commands, self.queue = self.queue, collections.deque()
+            else:
+                commands = [self.queue.popleft() for _ in range(self.max_edits_per_frame)]
+
+        self.apply_commands(commands)
+
+        # Report a dropped connection when all received commands are applied
+        if not commands and self.error:
+            raise self.error
 
     def controller_row_changed(self, row):
+        # The server only cares about integer rows
+        row = int(row)
+        if row == self.row:
+            return
+        self.row = row
         self.writer.byte(SET_ROW)
-        self.writer.int(int(row))
+        self.writer.int(row)
         logger.info(" <- row: %s", row)
 
     # # Not all editors support this (breaks compatibility)
@@ -84,16 +180,50 @@ class SocketConnector(Connector):
     #     self.writer.byte(PAUSE)
     #     self.writer.byte(state)
 
-    def read_command(self):
+    def apply_commands(self, commands):
         """
-        Attempt to read the next command from the editor/server
-        :return: boolean. Did we actually read a command?
+        Apply a list of decoded commands.
+        Key edits are collected per track and applied with Track.apply_edits,
+        so a burst of edits doesn't insert keys one by one.
+        Other commands are applied in order after the edits before them.
+        """
+        edits = {}
+        for comm, args in commands:
+            if comm == SET_KEY:
+                track_id, row, value, kind = args
+                edits.setdefault(track_id, []).append((row, value, kind))
+            elif comm == DELETE_KEY:
+                track_id, row = args
+                edits.setdefault(track_id, []).append((row, None, None))
+            else:
+                self.apply_edits(edits)
+                edits = {}
+                self.apply_command(comm, args)
+
+        self.apply_edits(edits)
+
+    def apply_edits(self, edits):
+        """
+        Apply collected key edits
+        :param edits: dict of track id -> list of (row, value, kind). A value of None deletes the key.
+        """
+        for track_id, track_edits in edits.items():
+            logger.info(" -> track=%s, %s key edits", track_id, len(track_edits))
+            track = self.tracks.get_by_id(track_id)
+            track.apply_edits(track_edits)
+            if self.journal:
+                for row, value, kind in track_edits:
+                    if value is None:
+                        self.journal.delete_key(track_id, track.name, row)
+                    else:
+                        self.journal.set_key(track_id, track.name, row, value, kind)
+
+    def apply_command(self, comm, args):
+        """
+        Apply a decoded command from the editor/server
+        :param comm: The command id
+        :param args: Tuple of command arguments
         """
-        # Do a non-blocking read here so the demo can keep running if there is no data
-        comm = self.reader.byte(blocking=False)
-        if comm is None:
-            return False
-
         cmds = {
             SET_KEY: self.handle_set_key,
             DELETE_KEY: self.handle_delete_key,
@@ -101,47 +231,39 @@ class SocketConnector(Connector):
             PAUSE: self.handle_pause,
             SAVE_TRACKS: self.handle_save_tracks
         }
+        cmds[comm](*args)
 
-        func = cmds.get(comm)
-
-        if func:
-            func()
-        else:
-            logger.error("Unknown command: %s", comm)
-
-        return True
-
-    def handle_set_key(self):
-        """Read incoming key from server"""
-        track_id = self.reader.int()
-        row = self.reader.int()
-        value = self.reader.float()
-        kind = self.reader.byte()
+    def handle_set_key(self, track_id, row, value, kind):
+        """Incoming key from server"""
         logger.info(" -> track=%s, row=%s, value=%s, type=%s", track_id, row, value, kind)
 
         # Add or update track value
         track = self.tracks.get_by_id(track_id)
         track.add_or_update(row, value, kind)
+        if self.journal:
+            self.journal.set_key(track_id, track.name, row, value, kind)
 
-    def handle_delete_key(self):
-        """Read incoming delete key event from server"""
-        track_id = self.reader.int()
-        row = self.reader.int()
+    def handle_delete_key(self, track_id, row):
+        """Incoming delete key event from server"""
         logger.info(" -> track=%s, row=%s", track_id, row)
 
         # Delete the actual track value
         track = self.tracks.get_by_id(track_id)
         track.delete(row)
+        if self.journal:
+            self.journal.delete_key(track_id, track.name, row)
 
-    def handle_set_row(self):
-        """Read incoming row change from server"""
-        row = self.reader.int()
+    def handle_set_row(self, row):
+        """Incoming row change from server"""
         logger.info(" -> row: %s", row)
+        # Don't echo the row back to the server
+        self.row = row
         self.controller.row = row
+        if self.journal:
+            self.journal.set_row(row)
 
-    def handle_pause(self):
-        """Read pause signal from server"""
-        flag = self.reader.byte()
+    def handle_pause(self, flag):
+        """Pause signal from server"""
         if flag > 0:
             logger.info(" -> pause: on")
             self.controller.playing = False
@@ -154,51 +276,121 @@ class SocketConnector(Connector):
         self.tracks.save()
 
 
+def decode_commands(data):
+    """
+    Decode all complete commands in a buffer
+    :param data: Buffer with data received from the editor/server
+    :return: Tuple with a list of (command, args) and the number of bytes consumed.
+             Bytes of a partial command at the end are not consumed.
+    """
+    commands = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        comm = data[pos]
+        fmt = COMMAND_FORMATS.get(comm)
+        if fmt is None:
+            logger.error("Unknown command: %s", comm)
+            pos += 1
+            continue
+
+        if pos + 1 + fmt.size > end:
+            break
+
+        commands.append((comm, fmt.unpack_from(data, pos + 1)))
+        pos += 1 + fmt.size
+
+    return commands, pos
+
+
 class BinaryReader:
-    """Helper namespace for reading binary data from a socket"""
-    def __init__(self, sock):
+    """
+    Buffered reader for data from a socket.
+    Incoming data is read in bulk and complete commands are parsed from the buffer.
+    Partial commands stay in the buffer until the rest of the data arrives.
+    """
+    def __init__(self, sock, recv_size=1024 * 1024):
         self.sock = sock
+        self.recv_size = recv_size
+        self.buffer = bytearray()
 
-    def bytes(self, n, blocking=True):
-        return self._read(n, blocking=blocking)
+    def bytes(self, n):
+        """Blocking read of exactly n bytes"""
+        while len(self.buffer) < n:
+            self.recv()
 
-    def byte(self, blocking=True):
-        data = self._read(1, blocking=blocking)
-        if data is None:
-            return None
-        return int.from_bytes(data, byteorder='big')
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
 
-    def int(self, blocking=True):
-        return struct.unpack('>I', self._read(4, blocking=blocking))[0]
+    def fill(self):
+        """
+        Read all available data without blocking.
+        The socket must be in non-blocking mode.
+        :return: Number of bytes read
+        """
+        try:
+            return self.recv()
+        except BlockingIOError:
+            return 0
 
-    def float(self, blocking=True):
-        return struct.unpack('>f', self._read(4, blocking=blocking))[0]
+    def commands(self):
+        """Remove and return all complete commands in the buffer"""
+        commands, consumed = decode_commands(self.buffer)
+        del self.buffer[:consumed]
+        return commands
 
-    def _read(self, count, blocking=True):
-        if blocking:
-            return self.sock.recv(count)
-        else:
-            # The select will return a socket only if data is avaialble
-            rd_sock, wrt_sock, err_sock = select.select([self.sock], [], [], 0)
-            if not rd_sock:
-                return None
+    def recv(self):
+        """Read available data into the buffer. Blocks if the socket is in blocking mode."""
+        try:
+            data = self.sock.recv(self.recv_size)
+        except BlockingIOError:
+            raise
+        except OSError as e:
+            raise SocketConnError("Connection lost: {}".format(e))
 
-            return rd_sock[0].recv(count)
+        if not data:
+            raise SocketConnError("Connection closed by server")
+
+        self.buffer += data
+        return len(data)
 
 
 class BinaryWriter:
-    """Helper for sending binary data"""
+    """
+    Buffered writer for sending binary data.
+    Data is queued until flush() is called.
+    """
     def __init__(self, sock):
         self.sock = sock
+        self.buffer = bytearray()
 
     def byte(self, value):
-        self.sock.send(value.to_bytes(1, byteorder='big', signed=False))
+        self.buffer += value.to_bytes(1, byteorder='big', signed=False)
 
     def bytes(self, data):
-        self.sock.write(data)
+        self.buffer += data
 
     def string(self, data):
-        self.sock.send(data.encode())
+        self.buffer += data.encode()
 
     def int(self, value):
-        self.sock.send(value.to_bytes(4, byteorder='big', signed=False))
+        self.buffer += value.to_bytes(4, byteorder='big', signed=False)
+
+    def flush(self):
+        """
+        Send queued data. In non-blocking mode data the socket
+        can't accept right now stays queued for the next flush.
+        :return: Number of bytes sent
+        """
+        total = 0
+        while self.buffer:
+            try:
+                sent = self.sock.send(self.buffer)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                raise SocketConnError("Connection lost: {}".format(e))
+            del self.buffer[:sent]
+            total += sent
+        return total
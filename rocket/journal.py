@@ -0,0 +1,194 @@
+"""
+Append-only journal of edits received from the editor.
+
+The journal can be replayed on top of a base export to rebuild
+the tracks at any point of an editing session:
+
+    python -m rocket.journal replay ./data session.journal ./restored
+    python -m rocket.journal replay ./data session.journal ./restored --until 1000
+    python -m rocket.journal info session.journal
+
+Records use the same layout as the editor protocol (big endian):
+
+    4 bytes: magic 'RKTJ'
+    records:
+        byte 2 (GET_TRACK): uint32 track id, uint32 name length, utf-8 name
+        byte 0 (SET_KEY): uint32 track id, uint32 row, float32 value, byte interpolation
+        byte 1 (DELETE_KEY): uint32 track id, uint32 row
+        byte 3 (SET_ROW): uint32 row
+
+Track ids are only valid within a journal and are mapped to names by the GET_TRACK records.
+"""
+import argparse
+import logging
+import os
+import struct
+
+from rocket.connectors.files import FilesConnector
+from rocket.connectors.socket import COMMAND_FORMATS, SET_KEY, DELETE_KEY, GET_TRACK, SET_ROW
+from rocket.controllers import Controller
+from rocket.tracks import Track, TrackContainer
+
+logger = logging.getLogger("rocket")
+
+MAGIC = b'RKTJ'
+TRACK = struct.Struct('>II')
+
+
+class Journal:
+    """
+    Buffered journal writer.
+    Records are collected in the file buffer and only written by flush()
+    or when the buffer is full, so recording an edit doesn't cost a syscall.
+    """
+    def __init__(self, filepath, buffer_size=64 * 1024):
+        self.filepath = filepath
+        self.fd = open(filepath, 'ab', buffering=buffer_size)
+        if self.fd.tell() == 0:
+            self.fd.write(MAGIC)
+        # Track ids with a name record in this journal
+        self.track_ids = set()
+
+    def track(self, track_id, name):
+        """Record the name of a track id"""
+        data = name.encode()
+        self.fd.write(bytes([GET_TRACK]) + TRACK.pack(track_id, len(data)) + data)
+        self.track_ids.add(track_id)
+
+    def set_key(self, track_id, name, row, value, kind):
+        if track_id not in self.track_ids:
+            self.track(track_id, name)
+        self.fd.write(bytes([SET_KEY]) + COMMAND_FORMATS[SET_KEY].pack(track_id, row, value, kind))
+
+    def delete_key(self, track_id, name, row):
+        if track_id not in self.track_ids:
+            self.track(track_id, name)
+        self.fd.write(bytes([DELETE_KEY]) + COMMAND_FORMATS[DELETE_KEY].pack(track_id, row))
+
+    def set_row(self, row):
+        self.fd.write(bytes([SET_ROW]) + COMMAND_FORMATS[SET_ROW].pack(row))
+
+    def flush(self):
+        self.fd.flush()
+
+    def close(self):
+        self.fd.close()
+
+
+def read_journal(filepath):
+    """
+    Read all complete records in a journal.
+    A partial record at the end (from a crash during a write) is ignored.
+    :return: Generator of (command, args) tuples. GET_TRACK args are (track_id, name).
+    """
+    with open(filepath, 'rb') as fd:
+        data = fd.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not an edit journal: {}".format(filepath))
+
+    pos = len(MAGIC)
+    end = len(data)
+    while pos < end:
+        comm = data[pos]
+        pos += 1
+        if comm == GET_TRACK:
+            if pos + TRACK.size > end:
+                break
+            track_id, length = TRACK.unpack_from(data, pos)
+            if pos + TRACK.size + length > end:
+                break
+            name = data[pos + TRACK.size:pos + TRACK.size + length].decode()
+            pos += TRACK.size + length
+            yield comm, (track_id, name)
+            continue
+
+        fmt = COMMAND_FORMATS.get(comm)
+        if fmt is None:
+            raise ValueError("Corrupt journal record {} at offset {}".format(comm, pos - 1))
+        if pos + fmt.size > end:
+            logger.warning("Ignoring partial record at the end of %s", filepath)
+            break
+        yield comm, fmt.unpack_from(data, pos)
+        pos += fmt.size
+
+
+def replay(filepath, tracks, until=None):
+    """
+    Apply the edits in a journal to a track container
+    :param filepath: The journal file
+    :param tracks: TrackContainer with the base data
+    :param until: Only apply this many edit records (SET_KEY, DELETE_KEY and SET_ROW)
+    :return: The last row set by the editor or None
+    """
+    names = {}
+    row = None
+    applied = 0
+    for comm, args in read_journal(filepath):
+        if comm == GET_TRACK:
+            names[args[0]] = args[1]
+            continue
+
+        if until is not None and applied >= until:
+            break
+        applied += 1
+
+        if comm == SET_KEY:
+            track_id, key_row, value, kind = args
+            track(tracks, names[track_id]).add_or_update(key_row, value, kind)
+        elif comm == DELETE_KEY:
+            track_id, key_row = args
+            t = track(tracks, names[track_id])
+            # The key may predate the base export
+            if t.has_key(key_row):
+                t.delete(key_row)
+        elif comm == SET_ROW:
+            row = args[0]
+
+    logger.info("Replayed %s records from %s", applied, filepath)
+    return row
+
+
+def track(tracks, name):
+    """Get or create a track without notifying a connector"""
+    if name not in tracks.tracks:
+        tracks.add(Track(name))
+    return tracks.get(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    replay_parser = sub.add_parser('replay', help="Fold a journal onto a base export and save the result")
+    replay_parser.add_argument('base', help="Directory with the base track files")
+    replay_parser.add_argument('journal', help="Journal file")
+    replay_parser.add_argument('output', help="Output directory for the track files")
+    replay_parser.add_argument('--until', type=int, default=None, help="Number of edits to apply")
+
+    info_parser = sub.add_parser('info', help="Summarize a journal")
+    info_parser.add_argument('journal', help="Journal file")
+
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        counts = {}
+        for comm, _ in read_journal(args.journal):
+            counts[comm] = counts.get(comm, 0) + 1
+        print("tracks: {}".format(counts.get(GET_TRACK, 0)))
+        print("set key: {}".format(counts.get(SET_KEY, 0)))
+        print("delete key: {}".format(counts.get(DELETE_KEY, 0)))
+        print("set row: {}".format(counts.get(SET_ROW, 0)))
+        return
+
+    tracks = TrackContainer(args.output)
+    FilesConnector(args.base, controller=Controller(1), tracks=tracks)
+    row = replay(args.journal, tracks, until=args.until)
+    os.makedirs(args.output, exist_ok=True)
+    tracks.save(force=True)
+    print("Saved {} tracks to {} (editor row: {})".format(len(tracks.track_index), args.output, row))
+
+
+if __name__ == '__main__':
+    main()
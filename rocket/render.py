@@ -0,0 +1,163 @@
+"""
+Offline evaluation of every track at every frame of a row range.
+
+The work is split by track and frame chunk across a process pool. Results are
+written straight into a memory mapped float32 .npy file with one column per track
+(column major, so each track is contiguous), and the track names are written to
+<output>.names with one name per line.
+
+    python -m rocket.render example.xml values.npy --rps 24 --fps 60 --start 0 --end 4800
+    python -m rocket.render ./data values.npy --rps 24 --fps 60 --end 4800 --workers 8
+    python -m rocket.render tracks.bundle values.npy --rps 24 --fps 60 --end 4800
+
+Load the result with numpy.load('values.npy', mmap_mode='r').
+Requires numpy.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rocket import bundle
+from rocket.connectors import BundleConnector, FilesConnector, ProjectFileConnector, SharedMemoryConnector
+from rocket.controllers import Controller
+from rocket.shared import SharedTracks, shared_memory
+from rocket.tracks import TrackContainer, frame_count, frame_rows
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger("rocket")
+
+# Per process state set up by the pool initializer
+_worker = {}
+
+
+def load_tracks(source, rows_per_second=24):
+    """
+    Load tracks from a project file, a track directory or a bundle file
+    :return: TrackContainer
+    """
+    controller = Controller(rows_per_second)
+    tracks = TrackContainer(None)
+    tracks.controller = controller
+
+    if os.path.isdir(source):
+        FilesConnector(source, controller=controller, tracks=tracks)
+    else:
+        with open(source, 'rb') as fd:
+            magic = fd.read(len(bundle.MAGIC))
+        if magic == bundle.MAGIC:
+            BundleConnector(source, controller=controller, tracks=tracks)
+        else:
+            ProjectFileConnector(source, controller=controller, tracks=tracks)
+
+    return tracks
+
+
+def _init_worker(source, shm_name, output, start_row, step):
+    """Load or attach to the tracks and open the output file once per process"""
+    if shm_name:
+        tracks = TrackContainer(None)
+        SharedMemoryConnector(shm_name, controller=Controller(24), tracks=tracks)
+    else:
+        tracks = load_tracks(source)
+
+    _worker.update(
+        tracks=tracks,
+        out=numpy.load(output, mmap_mode='r+'),
+        start_row=start_row,
+        step=step,
+    )
+
+
+def _render_chunk(task):
+    """Evaluate one track for a chunk of frames and write the column slice"""
+    col, name, first, last = task
+    track = _worker['tracks'].get(name)
+    rows = frame_rows(_worker['start_row'], _worker['step'], first, last)
+    _worker['out'][first:last, col] = track.sample_rows(rows)
+    return last - first
+
+
+def render(source, output, start_row, end_row, rows_per_second, fps, workers=None, chunk_size=64 * 1024,
+           shared=True):
+    """
+    Evaluate all tracks for every frame in [start_row, end_row) into a .npy file
+    :param source: Project file, track directory or bundle file
+    :param output: Path to the .npy file
+    :param rows_per_second: Rows per second of the project
+    :param fps: Output frames per second
+    :param workers: Number of worker processes. 0 evaluates in this process.
+    :param chunk_size: Number of frames per task
+    :param shared: Publish the tracks to shared memory instead of loading them in every worker
+    :return: List of track names in column order
+    """
+    if numpy is None:
+        raise RuntimeError("Rendering requires numpy")
+
+    tracks = load_tracks(source, rows_per_second)
+    names = [t.name for t in tracks.track_index]
+    step = rows_per_second / fps
+    frames = frame_count(start_row, end_row, step)
+
+    # Write the header and size the file. Workers fill in the data through their own maps.
+    out = numpy.lib.format.open_memmap(output, mode='w+', dtype=numpy.float32,
+                                       shape=(frames, len(names)), fortran_order=True)
+    del out
+    with open("{}.names".format(output), 'w', encoding='utf-8') as fd:
+        fd.writelines("{}\n".format(name) for name in names)
+
+    tasks = [(col, name, first, min(first + chunk_size, frames))
+             for col, name in enumerate(names)
+             for first in range(0, frames, chunk_size)]
+
+    start = time.time()
+    if workers == 0:
+        _worker.update(tracks=tracks, out=numpy.load(output, mmap_mode='r+'), start_row=start_row, step=step)
+        for task in tasks:
+            _render_chunk(task)
+        _worker['out'].flush()
+        _worker.clear()
+    else:
+        store = None
+        if shared and shared_memory is not None:
+            store = SharedTracks.publish(tracks)
+
+        try:
+            initargs = (source, store.name if store else None, output, start_row, step)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+                for _ in pool.map(_render_chunk, tasks, chunksize=max(1, len(tasks) // (4 * (workers or 8)))):
+                    pass
+        finally:
+            if store:
+                store.close()
+                store.unlink()
+
+    logger.info("Rendered %s frames of %s tracks in %.2f seconds", frames, len(names), time.time() - start)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="Project file, track directory or bundle file")
+    parser.add_argument('output', help="Output .npy file")
+    parser.add_argument('--rps', type=float, default=24, help="Rows per second of the project")
+    parser.add_argument('--fps', type=float, default=60, help="Output frames per second")
+    parser.add_argument('--start', type=float, default=0, help="First row")
+    parser.add_argument('--end', type=float, required=True, help="End row (exclusive)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (0: no pool)")
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024, help="Frames per task")
+    parser.add_argument('--no-shared', action='store_true', help="Load the tracks in every worker")
+    args = parser.parse_args()
+
+    names = render(args.source, args.output, args.start, args.end, args.rps, args.fps,
+                   workers=args.workers, chunk_size=args.chunk_size, shared=not args.no_shared)
+    print("Wrote {} tracks to {}".format(len(names), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,4 @@
 import logging
-from .connectors import SocketConnector
-from .connectors import ProjectFileConnector
-from .connectors import FilesConnector
 from .tracks import TrackContainer
 
 logger = logging.getLogger("rocket")
@@ -21,35 +18,124 @@ class Rocket:
         self.controller = controller
         self.connector = None
         self.tracks = TrackContainer(track_path)
+        self._stats = None
+        # Tracks included in snapshots (None for all tracks) and the memoized snapshot
+        self._snapshot_tracks = None
+        self._snapshot = None
+        self._snapshot_key = None
         # hack in reference so we can look up tracks_per_second
         self.tracks.controller = self.controller
 
     @staticmethod
-    def from_files(controller, track_path, log_level=logging.ERROR):
-        """Create rocket instance using project file connector"""
+    def from_files(controller, track_path, log_level=logging.ERROR, *, baked=False, threads=None, lazy=False,
+                   watch=False):
+        """
+        Create rocket instance using files connector.
+        Files can be loaded using a thread pool or lazily when tracks are requested.
+        When watching, changed files are reloaded in update().
+        """
+        from .connectors import FilesConnector
         rocket = Rocket(controller, track_path=track_path, log_level=log_level)
         rocket.connector = FilesConnector(track_path,
                                           controller=controller,
-                                          tracks=rocket.tracks)
+                                          tracks=rocket.tracks,
+                                          baked=baked,
+                                          threads=threads,
+                                          lazy=lazy,
+                                          watch=watch)
         return rocket
 
     @staticmethod
-    def from_project_file(controller, project_file, track_path=None, log_level=logging.ERROR):
-        """Create rocket instance using project file connector"""
+    def from_project_file(controller, project_file, track_path=None, log_level=logging.ERROR, *, cache_file=None,
+                          watch=False):
+        """
+        Create rocket instance using project file connector.
+        The parsed project is stored in cache_file and loaded from it while the project file is unchanged.
+        When watching, the project file is reloaded in update() when it changes.
+        """
+        from .connectors import ProjectFileConnector
         rocket = Rocket(controller, track_path=track_path, log_level=log_level)
         rocket.connector = ProjectFileConnector(project_file,
                                                 controller=controller,
-                                                tracks=rocket.tracks)
+                                                tracks=rocket.tracks,
+                                                cache_file=cache_file,
+                                                watch=watch)
         return rocket
 
     @staticmethod
-    def from_socket(controller, host=None, port=None, track_path=None, log_level=logging.ERROR):
-        """Create rocket instance using socket connector"""
+    def from_bundle(controller, bundle_file, track_path=None, log_level=logging.ERROR):
+        """Create rocket instance using bundle connector"""
+        from .connectors import BundleConnector
         rocket = Rocket(controller, track_path=track_path, log_level=log_level)
+        rocket.connector = BundleConnector(bundle_file,
+                                           controller=controller,
+                                           tracks=rocket.tracks)
+        return rocket
+
+    @staticmethod
+    def from_shared_memory(controller, name, track_path=None, log_level=logging.ERROR):
+        """
+        Create rocket instance using tracks published to shared memory by another process.
+        Keys are read in place. Tracks are read only.
+        """
+        from .connectors import SharedMemoryConnector
+        rocket = Rocket(controller, track_path=track_path, log_level=log_level)
+        rocket.connector = SharedMemoryConnector(name,
+                                                 controller=controller,
+                                                 tracks=rocket.tracks)
+        return rocket
+
+    @staticmethod
+    def from_socket(controller, host=None, port=None, track_path=None, log_level=logging.ERROR, *, bundle_file=None,
+                    threaded=False, max_edits_per_frame=None, background_save=False, journal_file=None):
+        """
+        Create rocket instance using socket connector.
+        Remote exports are written to track_path and optionally to a bundle file.
+        Exports only write changed tracks, optionally on a background thread.
+        In threaded mode a background thread receives commands and update()
+        applies at most max_edits_per_frame of them per call.
+        Applied edits are recorded to journal_file when specified.
+        """
+        from .connectors import SocketConnector
+        journal = None
+        if journal_file:
+            from .journal import Journal
+            journal = Journal(journal_file)
+
+        rocket = Rocket(controller, track_path=track_path, log_level=log_level)
+        rocket.tracks.bundle_file = bundle_file
+        rocket.tracks.background_save = background_save
         rocket.connector = SocketConnector(controller=controller,
                                            tracks=rocket.tracks,
                                            host=host,
-                                           port=port)
+                                           port=port,
+                                           threaded=threaded,
+                                           max_edits_per_frame=max_edits_per_frame,
+                                           journal=journal)
+        return rocket
+
+    @staticmethod
+    async def from_async_socket(controller, host=None, port=None, track_path=None, log_level=logging.ERROR, *,
+                                bundle_file=None, journal_file=None):
+        """
+        Create rocket instance using the asyncio socket connector.
+        This is a coroutine returning the rocket instance once the server is greeted.
+        Applied edits are recorded to journal_file when specified.
+        """
+        from .connectors import AsyncSocketConnector
+        journal = None
+        if journal_file:
+            from .journal import Journal
+            journal = Journal(journal_file)
+
+        rocket = Rocket(controller, track_path=track_path, log_level=log_level)
+        rocket.tracks.bundle_file = bundle_file
+        rocket.connector = AsyncSocketConnector(controller=controller,
+                                                tracks=rocket.tracks,
+                                                host=host,
+                                                port=port,
+                                                journal=journal)
+        await rocket.connector.connect()
         return rocket
 
     @property
@@ -70,6 +156,29 @@ class Rocket:
     def update(self):
         self.controller.update()
         self.connector.update()
+        self.tracks.finish_saves()
+
+    def enable_stats(self, on_update=None):
+        """
+        Start collecting runtime stats.
+        :param on_update: Optional callback called with (controller_time, connector_time) after each update
+        """
+        from .stats import Stats
+        self.disable_stats()
+        self._stats = Stats(self, on_update=on_update)
+        self._stats.enable()
+
+    def disable_stats(self):
+        """Stop collecting stats and remove all instrumentation"""
+        if self._stats:
+            self._stats.disable()
+            self._stats = None
+
+    def stats(self):
+        """Get collected stats or None if stats are not enabled"""
+        if self._stats:
+            return self._stats.report()
+        return None
 
     def value(self, name):
         """get value of a track at the current time"""
@@ -80,3 +189,51 @@ class Rocket:
 
     def track(self, name):
         return self.tracks.get_or_create(name)
+
+    def handle(self, name):
+        """
+        Get a pre-resolved handle to a track.
+        Reading handle.value skips the track lookup done by value().
+        """
+        return TrackHandle(self.track(name), self.controller)
+
+    def set_snapshot_tracks(self, names=None):
+        """Limit snapshots to a subset of tracks. None includes all tracks."""
+        self._snapshot_tracks = None if names is None else [self.track(name) for name in names]
+        self._snapshot = None
+
+    def snapshot(self):
+        """
+        Get the values of all snapshot tracks at the current row.
+        The result is memoized until the row changes or a key is edited,
+        so it's evaluated at most once per frame. Don't modify it.
+        :return: dict of track name -> value
+        """
+        row = self.controller.row
+        if self._snapshot is not None and self._snapshot_key == (row, self.tracks.version):
+            return self._snapshot
+
+        tracks = self._snapshot_tracks
+        if tracks is None:
+            tracks = self.tracks.loaded_tracks()
+        self._snapshot = {t.name: t.row_value(row) for t in tracks}
+        # Read the version after evaluating since lazy tracks may have been loaded
+        self._snapshot_key = (row, self.tracks.version)
+        return self._snapshot
+
+
+class TrackHandle:
+    """Track bound to the current row of a controller"""
+    __slots__ = ('track', 'controller')
+
+    def __init__(self, track, controller):
+        self.track = track
+        self.controller = controller
+
+    @property
+    def value(self):
+        return self.track.row_value(self.controller.row)
+
+    @property
+    def int_value(self):
+        return int(self.track.row_value(self.controller.row))
@@ -0,0 +1,228 @@
+"""
+Local stand-in for the rocket editor.
+Speaks the editor side of the sync protocol so clients can be tested
+and benchmarked without running a real editor.
+
+    python -m rocket.server --port 1338 --edits 10000
+"""
+import argparse
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+
+from rocket.connectors.socket import (
+    CLIENT_GREET, SERVER_GREET, SYNC_DEFAULT_PORT, COMMAND_FORMATS,
+    SET_KEY, DELETE_KEY, GET_TRACK, SET_ROW, PAUSE, SAVE_TRACKS,
+)
+from rocket.tracks import LINEAR
+
+logger = logging.getLogger("rocket")
+
+INT = struct.Struct('>I')
+
+
+class EditorServer:
+    """
+    Minimal editor serving a single client.
+    Track ids are assigned in the order the client requests tracks (GET_TRACK).
+    Keys added before a track is requested are sent when the client requests it,
+    like the real editor does.
+    """
+    def __init__(self, host="127.0.0.1", port=SYNC_DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.client = None
+        self.thread = None
+
+        self.lock = threading.RLock()
+        self.client_ready = threading.Event()
+        self.track_event = threading.Condition(self.lock)
+        # Track names by id and keys by name: {row: (value, kind)}
+        self.track_names = []
+        self.keys = {}
+        # Last row reported by the client
+        self.row = None
+        self.rows_received = 0
+        self.out = bytearray()
+
+    def start(self):
+        """Start listening. Returns the port in use (useful with port=0)."""
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((self.host, self.port))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+        self.thread = threading.Thread(target=self._serve, name="rocket-editor", daemon=True)
+        self.thread.start()
+        return self.port
+
+    def stop(self, timeout=5):
+        """Disconnect the client and wait for the server thread to exit"""
+        for sock in (self.client, self.server):
+            if sock:
+                # Wakes up the blocking recv/accept and sends FIN to the client
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def wait_for_client(self, timeout=None):
+        if not self.client_ready.wait(timeout):
+            raise TimeoutError("No client connected")
+
+    def wait_for_tracks(self, count, timeout=None):
+        """Wait until the client has requested a number of tracks"""
+        with self.track_event:
+            if not self.track_event.wait_for(lambda: len(self.track_names) >= count, timeout):
+                raise TimeoutError("Client requested {} of {} tracks".format(len(self.track_names), count))
+
+    def track_id(self, track):
+        """Resolve a track name or id to an id"""
+        if isinstance(track, int):
+            return track
+        return self.track_names.index(track)
+
+    # Commands to the client. They are queued until flush() is called.
+
+    def set_key(self, track, row, value, kind=LINEAR):
+        with self.lock:
+            track_id = self.track_id(track)
+            self.keys[self.track_names[track_id]][row] = (value, kind)
+            self._queue(SET_KEY, track_id, row, value, kind)
+
+    def delete_key(self, track, row):
+        with self.lock:
+            track_id = self.track_id(track)
+            self.keys[self.track_names[track_id]].pop(row, None)
+            self._queue(DELETE_KEY, track_id, row)
+
+    def set_row(self, row):
+        self._queue(SET_ROW, row)
+
+    def pause(self, flag):
+        self._queue(PAUSE, int(flag))
+
+    def save_tracks(self):
+        self._queue(SAVE_TRACKS)
+
+    def flush(self):
+        """Send all queued commands"""
+        # Sent under the lock so flushes from the server and scripting threads don't interleave
+        with self.lock:
+            data, self.out = bytes(self.out), bytearray()
+            self.client.sendall(data)
+        return len(data)
+
+    def add_key(self, name, row, value, kind=LINEAR):
+        """Add a key to a track that may not be requested yet"""
+        with self.lock:
+            self.keys.setdefault(name, {})[row] = (value, kind)
+            if name in self.track_names:
+                self._queue(SET_KEY, self.track_names.index(name), row, value, kind)
+
+    def random_edits(self, count, rows=10000, delete_ratio=0.1, seed=None):
+        """
+        Queue a stream of random key edits over all requested tracks
+        :return: Number of queued commands
+        """
+        rnd = random.Random(seed)
+        for _ in range(count):
+            track_id = rnd.randrange(len(self.track_names))
+            keys = self.keys[self.track_names[track_id]]
+            if keys and rnd.random() < delete_ratio:
+                self.delete_key(track_id, rnd.choice(list(keys)))
+            else:
+                self.set_key(track_id, rnd.randrange(rows), rnd.uniform(-1000.0, 1000.0), rnd.randint(0, 3))
+        return count
+
+    def burst(self, track, rows, value=0.0, kind=LINEAR):
+        """Queue one key per row on a track, like a paste in the editor"""
+        for row in rows:
+            self.set_key(track, row, value, kind)
+
+    def _queue(self, comm, *args):
+        with self.lock:
+            self.out.append(comm)
+            self.out += COMMAND_FORMATS[comm].pack(*args)
+
+    def _serve(self):
+        try:
+            self.client, _ = self.server.accept()
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            greet = self._read(len(CLIENT_GREET))
+            if greet.decode() != CLIENT_GREET:
+                logger.error("Invalid client greeting: %s", greet)
+                return
+            self.client.sendall(SERVER_GREET.encode())
+            self.client_ready.set()
+
+            while True:
+                comm = self._read(1)[0]
+                if comm == GET_TRACK:
+                    length = INT.unpack(self._read(4))[0]
+                    self._track_requested(self._read(length).decode())
+                elif comm == SET_ROW:
+                    self.row = INT.unpack(self._read(4))[0]
+                    self.rows_received += 1
+                else:
+                    logger.error("Unknown command from client: %s", comm)
+        except (ConnectionError, OSError):
+            pass
+
+    def _track_requested(self, name):
+        with self.track_event:
+            if name not in self.track_names:
+                self.track_names.append(name)
+            track_id = self.track_names.index(name)
+            for row, (value, kind) in sorted(self.keys.setdefault(name, {}).items()):
+                self._queue(SET_KEY, track_id, row, value, kind)
+            self.track_event.notify_all()
+        self.flush()
+
+    def _read(self, count):
+        data = b''
+        while len(data) < count:
+            chunk = self.client.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("Client disconnected")
+            data += chunk
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=SYNC_DEFAULT_PORT)
+    parser.add_argument('--edits', type=int, default=1000, help="Random edits per burst")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between bursts")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = EditorServer(host=args.host, port=args.port)
+    server.start()
+    print("Waiting for client on {}:{}".format(args.host, server.port))
+    server.wait_for_client()
+    print("Client connected")
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            if not server.track_names:
+                continue
+            server.random_edits(args.edits, seed=args.seed)
+            print("Sent {} bytes, client row: {}".format(server.flush(), server.row))
+    except (KeyboardInterrupt, ConnectionError, OSError):
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
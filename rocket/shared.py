@@ -0,0 +1,102 @@
+"""
+Track data shared between processes.
+
+A loaded track container is published to a shared memory block using the
+bundle format. Worker processes attach to the block by name and read the
+keys in place without decoding or copying them.
+
+    # Main process
+    store = SharedTracks.publish(rocket.tracks)
+    pool = multiprocessing.Pool(initializer=init_worker, initargs=(store.name,))
+    ...
+    store.close()
+    store.unlink()
+
+    # Worker process
+    rocket = Rocket.from_shared_memory(controller, name)
+    rocket.track("cube:size").row_value(10.5)
+
+Requires python 3.8 or later.
+"""
+import logging
+
+from rocket import bundle
+from rocket.bundle import Bundle
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+logger = logging.getLogger("rocket")
+
+
+class SharedTracks:
+    """Track bundle in a named shared memory block"""
+    def __init__(self, shm):
+        self.shm = shm
+        self.bundle = Bundle(shm.buf)
+        # Views handed out to tracks. Released on close.
+        self.views = []
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def publish(cls, tracks, name=None):
+        """
+        Copy all tracks in a container to a new shared memory block.
+        The publishing process owns the block and should unlink it when the workers are done.
+        :param tracks: TrackContainer
+        :param name: Optional name of the block. A unique name is generated by default.
+        """
+        if shared_memory is None:
+            raise RuntimeError("Shared memory requires python 3.8 or later")
+
+        chunks = list(bundle.encode(list(tracks.loaded_tracks())))
+        size = sum(len(c) for c in chunks)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        pos = 0
+        for data in chunks:
+            shm.buf[pos:pos + len(data)] = data
+            pos += len(data)
+
+        logger.info("Published %s tracks (%s bytes) to shared memory '%s'", len(tracks.track_index), size, shm.name)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to a block published by another process"""
+        if shared_memory is None:
+            raise RuntimeError("Shared memory requires python 3.8 or later")
+
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def names(self):
+        return self.bundle.names()
+
+    def load(self, track):
+        """Point the keys of a track at the shared memory block"""
+        views = self.bundle.view(track.name)
+        self.views.extend(views)
+        track.set_keys(*views)
+        # Read only data is never saved
+        track.dirty = False
+
+    def close(self):
+        """
+        Detach from the block.
+        Tracks loaded from the block can no longer be evaluated after this.
+        """
+        for view in self.views:
+            if isinstance(view, memoryview):
+                view.release()
+        self.views = []
+        self.bundle = None
+        self.shm.close()
+
+    def unlink(self):
+        """Destroy the block. Only the publishing process should do this."""
+        self.shm.unlink()
@@ -0,0 +1,176 @@
+"""
+Opt-in runtime instrumentation.
+Instrumentation is installed by wrapping methods on the instances in use,
+so nothing is measured or counted while stats are disabled.
+"""
+import time
+
+from rocket.connectors.socket import COMMAND_NAMES
+
+
+class Timer:
+    """Accumulated timing of a function"""
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.last = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def report(self):
+        return {
+            'calls': self.calls,
+            'total': self.total,
+            'mean': self.total / self.calls if self.calls else 0.0,
+            'max': self.max,
+        }
+
+
+class Stats:
+    """Collects timings, command and lookup counts for a rocket instance"""
+    def __init__(self, rocket, on_update=None):
+        """
+        :param rocket: The rocket instance
+        :param on_update: Optional callback called with (controller_time, connector_time) after each update
+        """
+        self.rocket = rocket
+        self.on_update = on_update
+        # Objects with instance attributes we have installed
+        self.patched = []
+        self.reset()
+
+    def reset(self):
+        self.controller_update = Timer()
+        self.connector_update = Timer()
+        self.commands = {}
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.lookups = {}
+
+    def enable(self):
+        rocket = self.rocket
+        self._patch(rocket.controller, 'update', self._timed(rocket.controller.update, self.controller_update))
+        self._patch(rocket.connector, 'update', self._timed_connector(rocket.connector.update))
+
+        if hasattr(rocket.connector, 'apply_commands'):
+            self._patch(rocket.connector, 'apply_commands', self._counted_commands(rocket.connector.apply_commands))
+        reader = getattr(rocket.connector, 'reader', None)
+        if hasattr(reader, 'recv'):
+            self._patch(reader, 'recv', self._counted_bytes(reader.recv, 'bytes_received'))
+        writer = getattr(rocket.connector, 'writer', None)
+        if hasattr(writer, 'flush'):
+            self._patch(writer, 'flush', self._counted_bytes(writer.flush, 'bytes_sent'))
+
+        # Tracks added later are instrumented as well
+        add = rocket.tracks.add
+
+        def instrumented_add(obj):
+            add(obj)
+            self._instrument_track(obj)
+
+        self._patch(rocket.tracks, 'add', instrumented_add)
+        for t in rocket.tracks.track_index:
+            self._instrument_track(t)
+
+    def disable(self):
+        """Remove all instrumentation"""
+        for obj, name in self.patched:
+            if name in obj.__dict__:
+                del obj.__dict__[name]
+        self.patched = []
+
+    def report(self):
+        """
+        Get a snapshot of the collected stats.
+        Times are in seconds and memory in bytes.
+        """
+        tracks = {}
+        for t in self.rocket.tracks.track_index:
+            tracks[t.name] = {
+                'keys': len(t.rows),
+                'bytes': track_memory(t),
+                'lookups': self.lookups.get(t.name, 0),
+                'loaded': t.loader is None,
+            }
+
+        return {
+            'controller_update': self.controller_update.report(),
+            'connector_update': self.connector_update.report(),
+            'commands': dict(self.commands),
+            'bytes_received': self.bytes_received,
+            'bytes_sent': self.bytes_sent,
+            'tracks': tracks,
+            'unsampled': sorted(name for name, t in tracks.items() if t['lookups'] == 0),
+        }
+
+    def _patch(self, obj, name, func):
+        obj.__dict__[name] = func
+        self.patched.append((obj, name))
+
+    def _instrument_track(self, track):
+        if 'row_value' in track.__dict__:
+            return
+
+        row_value = track.row_value
+        name = track.name
+        lookups = self.lookups
+        lookups.setdefault(name, 0)
+
+        def counted_row_value(row):
+            lookups[name] += 1
+            return row_value(row)
+
+        self._patch(track, 'row_value', counted_row_value)
+
+    def _timed(self, func, timer):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.add(time.perf_counter() - start)
+        return timed
+
+    def _timed_connector(self, func):
+        timed = self._timed(func, self.connector_update)
+
+        def timed_update():
+            try:
+                return timed()
+            finally:
+                if self.on_update:
+                    self.on_update(self.controller_update.last, self.connector_update.last)
+        return timed_update
+
+    def _counted_commands(self, func):
+        def counted(commands):
+            for comm, _ in commands:
+                name = COMMAND_NAMES.get(comm, comm)
+                self.commands[name] = self.commands.get(name, 0) + 1
+            return func(commands)
+        return counted
+
+    def _counted_bytes(self, func, attr):
+        def counted(*args, **kwargs):
+            count = func(*args, **kwargs)
+            setattr(self, attr, getattr(self, attr) + count)
+            return count
+        return counted
+
+
+def track_memory(track):
+    """Bytes used by the key data, segment tables and baked table of a track"""
+    arrays = []
+    for block in track._blocks:
+        arrays.extend((block.rows, block.values, block.kinds, block.inv, block.delta, block.kernel))
+    if track._flat:
+        arrays.extend(track._flat)
+    if track.baked:
+        arrays.extend(track.baked[2:])
+    return sum(len(a) * a.itemsize for a in arrays)
@@ -1,8 +1,15 @@
+from array import array
 import bisect
+import functools
 import logging
 import math
 import os
 import struct
+import sys
+import threading
+import zlib
+
+from rocket import bundle
 
 STEP = 0
 LINEAR = 1
@@ -12,30 +19,78 @@ RAMP = 3
 logger = logging.getLogger("rocket")
 
 
+@functools.lru_cache(maxsize=None)
+def import_numpy():
+    """
+    Import numpy on first use. numpy is optional and slow to import,
+    so playback only applications never load it.
+    :return: The numpy module or None if numpy is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
 class TrackContainer:
     """Keep track of tacks by their name and index"""
-    def __init__(self, track_path):
+    def __init__(self, track_path, bundle_file=None):
         self.tracks = {}
         self.track_index = []
         self.connector = None
         self.controller = None
         self.track_path = track_path
+        # Also write a track bundle when saving
+        self.bundle_file = bundle_file
+        # Write files on a background thread when saving
+        self.background_save = False
+        self.save_executor = None
+        # Background writes not yet applied to the dirty flags: (future, contents, version)
+        self.pending_saves = []
+        # Incremented on every key edit so cached values can be invalidated
+        self.version = 0
 
     def get(self, name):
-        return self.tracks[name]
+        t = self.tracks[name]
+        if t.loader is not None:
+            t.ensure_loaded()
+        return t
 
     def get_by_id(self, i):
-        return self.track_index[i]
+        t = self.track_index[i]
+        if t.loader is not None:
+            t.ensure_loaded()
+        return t
 
     def get_or_create(self, name):
         t = self.tracks.get(name)
         if not t:
             t = Track(name)
             self.add(t)
+        t.ensure_loaded()
 
         self.connector.track_added(name)
         return t
 
+    def register(self, name, loader):
+        """
+        Register a track without loading its keys.
+        The loader is called with the track the first time it's requested.
+        """
+        t = self.tracks.get(name)
+        if not t:
+            t = Track(name)
+            self.add(t)
+        t.loader = loader
+        return t
+
+    def loaded_tracks(self):
+        """Iterate all tracks, loading keys for lazily registered tracks"""
+        for t in self.track_index:
+            t.ensure_loaded()
+            yield t
+
     def add(self, obj):
         """
         Add pre-created tracks.
@@ -43,13 +98,19 @@ class TrackContainer:
         This way the pointer to the pre-created tracks are still valid.
         """
         obj.controller = self.controller
+        obj.container = self
+        self.version += 1
         # Is the track already loaded or created?
         track = self.tracks.get(obj.name)
         if track:
             if track == obj:
                 return
             # hijack the track data
-            obj.keys = track.keys
+            obj._blocks = track._blocks
+            obj._keys_replaced()
+            obj.baked = track.baked
+            obj.loader = track.loader
+            obj.dirty = track.dirty
             obj.controller = track.controller
             self.tracks[track.name] = obj
             self.track_index[self.track_index.index(track)] = obj
@@ -59,28 +120,372 @@ class TrackContainer:
             self.tracks[obj.name] = obj
             self.track_index.append(obj)
 
-    def save(self):
+    def save(self, force=False, background=None):
+        """
+        Save tracks to the track path and the optional bundle file.
+        Only tracks changed since they were loaded or saved are written.
+        Files are replaced atomically so readers never see half written files.
+        Tracks are marked clean once all files containing them are written.
+        :param force: Write all tracks
+        :param background: Write files on a background thread.
+                           Track data is encoded on the calling thread first.
+                           Defaults to the background_save attribute.
+                           Tracks are marked clean by finish_saves once the write is done.
+        :return: Future of the background write
+        """
+        if background is None:
+            background = self.background_save
+
+        self.finish_saves()
+
+        tracks = list(self.loaded_tracks())
+        writes = []
+        # Tracks contained in each write
+        contents = []
+
+        if self.bundle_file:
+            if force or not os.path.exists(self.bundle_file) or any(t.dirty for t in tracks):
+                logger.info("Saving track bundle: %s", self.bundle_file)
+                writes.append((self.bundle_file, b''.join(bundle.encode(tracks))))
+                contents.append((self.bundle_file, tracks))
+
         logger.info("Saving tracks to: %s", self.track_path)
         # Check if the path is valid
         if self.track_path is None:
-            logger.error("Track path is None")
+            if not self.bundle_file:
+                logger.error("Track path is None")
+        elif not os.path.exists(self.track_path):
+            logger.error("FAILED: Path '%s' do not exist", self.track_path)
+        else:
+            for t in tracks:
+                filepath = os.path.join(self.track_path, Track.filename(t.name))
+                if force or t.dirty or not os.path.exists(filepath):
+                    writes.append((filepath, encode_keys(t.rows, t.values, t.kinds)))
+                    contents.append((filepath, [t]))
+
+        version = self.version
+        logger.info("Writing %s files", len(writes))
+        if background:
+            if self.save_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.save_executor = ThreadPoolExecutor(max_workers=1)
+            future = self.save_executor.submit(write_files, writes)
+            self.pending_saves.append((future, contents, version))
+            return future
+
+        errors = write_files(writes)
+        self._saved(contents, version, errors)
+        if errors:
+            raise errors[0][1]
+
+    def finish_saves(self, wait=False):
+        """
+        Mark tracks written by finished background saves clean.
+        This runs on the thread editing the tracks (save and Rocket.update)
+        so an edit can't land between the version check and clearing the dirty flags.
+        :param wait: Wait for running background saves
+        """
+        pending = []
+        for future, contents, version in self.pending_saves:
+            if wait or future.done():
+                self._saved(contents, version, future.result())
+            else:
+                pending.append((future, contents, version))
+        self.pending_saves = pending
+
+    def _saved(self, contents, version, errors):
+        """
+        Mark tracks clean after writing files
+        :param contents: List of (filepath, tracks) for each written file
+        :param version: Container version when the data was encoded
+        :param errors: List of (index, exception) for failed writes
+        """
+        failed = set()
+        for i, e in errors:
+            filepath, tracks = contents[i]
+            logger.error("Failed to save '%s': %s", filepath, e)
+            failed.update(tracks)
+
+        # Tracks edited while writing have to be written again
+        if self.version != version:
             return
 
-        if not os.path.exists(self.track_path):
-            logger.error("FAILED: Path '%s' do not exist", self.track_path)
+        for _, tracks in contents:
+            for t in tracks:
+                if t not in failed:
+                    t.dirty = False
+
+    def save_bundle(self, filepath):
+        """Save all tracks into a single bundle file"""
+        logger.info("Saving track bundle: %s", filepath)
+        bundle.write_bundle(list(self.loaded_tracks()), filepath)
+
+    def compile(self):
+        """Compile segment tables for all tracks"""
+        for t in self.loaded_tracks():
+            t.compile()
+
+    def bake(self, resolution=1, max_bytes=64 * 1024 * 1024, min_keys=8):
+        """
+        Rasterize tracks into dense float32 lookup tables for playback of static data.
+        Tracks with few keys are cheap to evaluate and are skipped. The densest
+        tracks are baked first and sparse tracks fall back to key based
+        evaluation when the memory budget is exhausted.
+        :param resolution: Table entries per row
+        :param max_bytes: Memory budget for all tables
+        :param min_keys: Only bake tracks with at least this many keys
+        :return: List of baked tracks
+        """
+        candidates = [t for t in self.loaded_tracks() if len(t.rows) >= max(min_keys, 2)]
+        candidates.sort(key=lambda t: (t.rows[-1] - t.rows[0]) / len(t.rows))
+
+        baked = []
+        for t in candidates:
+            size = Track.baked_size(t.rows[-1] - t.rows[0], resolution)
+            if size > max_bytes:
+                logger.info("Not baking '%s': %s bytes exceeds remaining budget", t.name, size)
+                continue
+            t.bake(resolution=resolution)
+            max_bytes -= size
+            baked.append(t)
+
+        logger.info("Baked %s of %s tracks", len(baked), len(self.track_index))
+        return baked
+
+    def save_baked(self):
+        """Save lookup tables for baked tracks next to the track files"""
+        if self.track_path is None:
+            logger.error("Track path is None")
             return
 
-        for t in self.track_index:
-            t.save(self.track_path)
+        for t in self.loaded_tracks():
+            if t.baked:
+                t.save_baked(self.track_path)
+
+    def sample_all(self, rows):
+        """
+        Sample every track at the given rows
+        :param rows: Sequence of (fractional) rows
+        :return: dict of track name -> sampled values
+        """
+        numpy = import_numpy()
+        if numpy is not None:
+            rows = numpy.asarray(rows, dtype=numpy.float64)
+        return {t.name: t.sample_rows(rows) for t in self.loaded_tracks()}
 
+    def sample_matrix(self, rows, names=None, out=None):
+        """
+        Sample tracks at a row per object, for example many objects driven
+        by the same tracks with their own playheads. Requires numpy.
+        :param rows: Sequence of (fractional) rows, one per object
+        :param names: Names of the tracks to sample. All tracks by default.
+        :param out: Optional (objects, tracks) array to fill
+        :return: float64 array with one row per object and one column per track
+        """
+        numpy = import_numpy()
+        if numpy is None:
+            raise RuntimeError("sample_matrix requires numpy")
 
-# TODO: Insert and delete operations in keys list is expensive
+        if names is None:
+            names = [t.name for t in self.track_index]
+        rows = numpy.asarray(rows, dtype=numpy.float64)
+        if out is None:
+            out = numpy.empty((len(rows), len(names)), dtype=numpy.float64)
+
+        for col, name in enumerate(names):
+            out[:, col] = self.get(name).sample_rows(rows)
+        return out
+
+    def sample_times(self, times, offsets=0.0, scales=1.0, names=None, out=None):
+        """
+        Sample tracks at a time per object. Like Track.time_value the
+        rows per second of the controller converts times to rows.
+        Times, offsets and scales are broadcast against each other.
+        :param times: Time in seconds, one per object or a single time for all objects
+        :param offsets: Time offset in seconds per object
+        :param scales: Playback speed per object
+        :return: float64 array with one row per object and one column per track
+        """
+        numpy = import_numpy()
+        if numpy is None:
+            raise RuntimeError("sample_times requires numpy")
+
+        times = numpy.asarray(times, dtype=numpy.float64)
+        times = times * numpy.asarray(scales, dtype=numpy.float64) + numpy.asarray(offsets, dtype=numpy.float64)
+        return self.sample_matrix(numpy.atleast_1d(times) * self.controller.rows_per_second, names=names, out=out)
+
+    def evaluate_range(self, start_row, end_row, step=1.0, names=None, out=None, chunk_size=64 * 1024):
+        """
+        Evaluate tracks at evenly spaced rows in [start_row, end_row).
+        Requires numpy.
+        :param step: Rows per frame (rows_per_second / frames per second)
+        :param names: Names of the tracks to evaluate. All tracks by default.
+        :param out: Optional (frames, tracks) array to fill, for example a memory mapped file
+        :param chunk_size: Number of frames evaluated at a time
+        :return: float32 array with one row per frame and one column per track
+        """
+        numpy = import_numpy()
+        if numpy is None:
+            raise RuntimeError("evaluate_range requires numpy")
+
+        if names is None:
+            names = [t.name for t in self.track_index]
+        frames = frame_count(start_row, end_row, step)
+        if out is None:
+            out = numpy.empty((frames, len(names)), dtype=numpy.float32, order='F')
+
+        for col, name in enumerate(names):
+            track = self.get(name)
+            for first in range(0, frames, chunk_size):
+                last = min(first + chunk_size, frames)
+                out[first:last, col] = track.sample_rows(frame_rows(start_row, step, first, last))
+        return out
+
+
+class KeyBlock:
+    """
+    Sorted run of keys and its segment tables.
+    The segment tables are empty unless the track is compiled.
+    """
+    __slots__ = ('rows', 'values', 'kinds', 'inv', 'delta', 'kernel', 'writable')
+    typecodes = 'ifbddb'
+
+    def __init__(self, rows, values, kinds, inv=None, delta=None, kernel=None):
+        self.rows = rows
+        self.values = values
+        self.kinds = kinds
+        self.inv = array('d') if inv is None else inv
+        self.delta = array('d') if delta is None else delta
+        self.kernel = array('b') if kernel is None else kernel
+        # Keys in read only views (shared memory) are copied before editing
+        self.writable = all(isinstance(a, array) for a in (rows, values, kinds))
+
+    def split(self, size):
+        """
+        Copy the keys into blocks of at most size keys.
+        Read only views (shared memory) become arrays.
+        """
+        blocks = []
+        for start in range(0, len(self.rows), size):
+            parts = []
+            for name, typecode in zip(self.__slots__[:6], self.typecodes):
+                data = getattr(self, name)
+                part = array(typecode)
+                if len(data) > 0:
+                    part.frombytes(memoryview(data)[start:start + size].cast('B'))
+                parts.append(part)
+            blocks.append(KeyBlock(*parts))
+        return blocks
+
+
+# Single key edits only shift the keys of one block. Bulk edits should use apply_edits.
 class Track:
+    """
+    Keys are stored in parallel typed arrays using the same
+    types as the binary track format (int32, float32, int8).
+    Loaded keys are kept in a single block. The first single key edit splits
+    them into sorted blocks so inserts and deletes are a bisect and a short shift.
+    """
+    # Remember the last used key so monotonic playback avoids a bisect
+    use_cursor = True
+    # apply_edits merges when there are more edited rows than this
+    merge_threshold = 128
+    # Keys per block after splitting. Blocks are split again when they grow to twice this size.
+    block_size = 4096
+
     def __init__(self, name):
         self.name = name
-        self.keys = []
+        # Sorted key blocks and the first row of each block
+        self._blocks = []
+        self._firsts = array('i')
+        # Keys of all blocks joined into arrays, built on demand
+        self._flat = None
+        # Block, block index and key index of the key used by the previous lookup. Key index -1 if none.
+        self._cursor_keys = None
+        self._cursor_block = 0
+        self._cursor = -1
+        # Optional per segment tables in each block (see compile)
+        self.compiled = False
+        # Optional dense lookup table: (start row, entries per row, float32 table)
+        self.baked = None
+        # Called once to fill in the keys of lazily loaded tracks
+        self.loader = None
+        # Keys changed since the track was loaded or saved
+        self.dirty = False
         # Shortcut to controller for tracks_per_second lookups
         self.controller = None
+        # Container to notify about edits
+        self.container = None
+
+    @property
+    def rows(self):
+        """int32 array of rows"""
+        return self._keys()[0]
+
+    @property
+    def values(self):
+        """float32 array of values"""
+        return self._keys()[1]
+
+    @property
+    def kinds(self):
+        """int8 array of interpolation types"""
+        return self._keys()[2]
+
+    @property
+    def keys(self):
+        """List of TrackKey views into the key arrays"""
+        return [TrackKey(self, i) for i in range(len(self.rows))]
+
+    def _keys(self):
+        """Rows, values and kinds arrays of all keys. Single blocks are returned without copying."""
+        if len(self._blocks) == 1:
+            block = self._blocks[0]
+            return block.rows, block.values, block.kinds
+
+        if self._flat is None:
+            rows, values, kinds = array('i'), array('f'), array('b')
+            for block in self._blocks:
+                rows.extend(block.rows)
+                values.extend(block.values)
+                kinds.extend(block.kinds)
+            self._flat = rows, values, kinds
+        return self._flat
+
+    def _segments(self):
+        """Inverse length, value delta and kernel arrays of all keys of a compiled track"""
+        if len(self._blocks) == 1:
+            block = self._blocks[0]
+            return block.inv, block.delta, block.kernel
+
+        inv, delta, kernel = array('d'), array('d'), array('b')
+        for block in self._blocks:
+            inv.extend(block.inv)
+            delta.extend(block.delta)
+            kernel.extend(block.kernel)
+        return inv, delta, kernel
+
+    def has_key(self, row):
+        """Is there a key at row?"""
+        b, i = self._find_key_index(row)
+        return i >= 0 and self._blocks[b].rows[i] == row
+
+    def ensure_loaded(self):
+        """Run the pending loader of a lazily registered track"""
+        if self.loader is not None:
+            loader, self.loader = self.loader, None
+            loader(self)
+
+    def set_keys(self, rows, values, kinds):
+        """
+        Replace all keys. The keys must be sorted by row.
+        :param rows: int32 array of rows
+        :param values: float32 array of values
+        :param kinds: int8 array of interpolation types
+        """
+        self._blocks = [KeyBlock(rows, values, kinds)] if len(rows) > 0 else []
+        self._keys_replaced()
+        self.dirty = True
 
     def time_value(self, time):
         return self.row_value(time * self.controller.rows_per_second)
@@ -88,58 +493,469 @@ class Track:
     def row_value(self, row):
         """Get the tracks value at row"""
         irow = int(row)
+        if self.baked:
+            # Rows before the table are resolved by the keys
+            start, resolution, table, hold = self.baked
+            pos = (row - start) * resolution
+            if pos >= 0:
+                i = int(pos)
+                if i >= len(table) - 1:
+                    return table[-1]
+                # Don't blend into the next key of a STEP segment
+                if hold[i]:
+                    return table[i]
+                return table[i] + (table[i + 1] - table[i]) * (pos - i)
+
         i = self._get_key_index(irow)
         if i == -1:
             return 0.0
 
+        block = self._cursor_keys
+        if self.compiled:
+            t = (row - block.rows[i]) * block.inv[i]
+            kernel = block.kernel[i]
+            if kernel == LINEAR:
+                return block.values[i] + block.delta[i] * t
+            if kernel == SMOOTH:
+                return block.values[i] + block.delta[i] * (t * t * (3 - 2 * t))
+            if kernel == RAMP:
+                return block.values[i] + block.delta[i] * (t * t)
+            return block.values[i]
+
+        rows = block.rows
+        if i + 1 < len(rows):
+            return interpolate(block.kinds[i], rows[i], block.values[i], rows[i + 1], block.values[i + 1], row)
+
         # Are we dealing with the last key?
-        if i == len(self.keys) - 1:
-            return self.keys[-1].value
+        b = self._cursor_block + 1
+        if b == len(self._blocks):
+            return block.values[i]
+
+        # The next key starts the next block
+        following = self._blocks[b]
+        return interpolate(block.kinds[i], rows[i], block.values[i], following.rows[0], following.values[0], row)
+
+    def sample_rows(self, rows):
+        """
+        Get the tracks value at multiple rows in one call.
+        Values are identical to row_value, using the baked table and the compiled segments when present.
+        Returns a float64 numpy array when numpy is available, otherwise a list.
+        """
+        numpy = import_numpy()
+        if numpy is None:
+            return [self.row_value(row) for row in rows]
+
+        rows = numpy.asarray(rows, dtype=numpy.float64)
+        if not self.baked:
+            return self._sample_keys(numpy, rows)
+
+        # Rows before the table are resolved by the keys
+        start, resolution, table, hold = self.baked
+        pos = (rows - start) * resolution
+        baked = pos >= 0
+        result = numpy.empty(rows.shape, dtype=numpy.float64)
+        result[~baked] = self._sample_keys(numpy, rows[~baked])
+
+        pos = pos[baked]
+        table = numpy.frombuffer(table, dtype=numpy.float32).astype(numpy.float64)
+        hold = numpy.frombuffer(hold, dtype=numpy.int8)
+        last = len(table) - 1
+        i = numpy.minimum(pos.astype(numpy.int64), last)
+        following = numpy.minimum(i + 1, last)
+        # The end of the table and STEP segments hold their value
+        interpolated = table[i] + (table[following] - table[i]) * (pos - i)
+        result[baked] = numpy.where((i == last) | (hold[i] != 0), table[i], interpolated)
+        return result
+
+    def _sample_keys(self, numpy, rows):
+        """Evaluate the keys at a float64 array of rows"""
+        result = numpy.zeros(rows.shape, dtype=numpy.float64)
+        if not self._blocks:
+            return result
 
-        return TrackKey.interpolate(self.keys[i], self.keys[i + 1], row)
+        key_rows, key_values, key_kinds = self._keys()
+        key_rows = numpy.frombuffer(key_rows, dtype=numpy.int32).astype(numpy.int64)
+        key_values = numpy.frombuffer(key_values, dtype=numpy.float32).astype(numpy.float64)
+        key_kinds = numpy.frombuffer(key_kinds, dtype=numpy.int8)
+
+        # Same lookup as row_value: the last key at or before the integer row
+        index = numpy.searchsorted(key_rows, numpy.trunc(rows), side='right') - 1
+        active = index >= 0
+
+        if self.compiled:
+            inv, delta, kernel = self._segments()
+            i = index[active]
+            value = key_values[i]
+            kernel = numpy.frombuffer(kernel, dtype=numpy.int8)[i]
+            delta = numpy.frombuffer(delta, dtype=numpy.float64)[i]
+            t = (rows[active] - key_rows[i]) * numpy.frombuffer(inv, dtype=numpy.float64)[i]
+            t = numpy.where(kernel == SMOOTH, t * t * (3 - 2 * t), t)
+            t = numpy.where(kernel == RAMP, t * t, t)
+            result[active] = numpy.where(kernel == STEP, value, value + delta * t)
+            return result
+
+        last = index == len(key_rows) - 1
+        result[active & last] = key_values[-1]
+
+        inside = active & ~last
+        i = index[inside]
+        start = key_rows[i]
+        value = key_values[i]
+        kind = key_kinds[i]
+        t = (rows[inside] - start) / (key_rows[i + 1] - start)
+        t = numpy.where(kind == SMOOTH, t * t * (3 - 2 * t), t)
+        t = numpy.where(kind == RAMP, t * t, t)
+        interpolated = value + (key_values[i + 1] - value) * t
+        result[inside] = numpy.where(kind == STEP, value, interpolated)
+        return result
 
     def add_or_update(self, row, value, kind):
         """Add or update a track value"""
-        i = bisect.bisect_left(self.keys, row)
+        if not self._blocks:
+            self.set_keys(array('i', [row]), array('f', [value]), array('b', [kind]))
+            return
+
+        b = self._edit_block(row)
+        block = self._blocks[b]
+        i = bisect.bisect_left(block.rows, row)
 
         # Are we simply replacing a key?
-        if i < len(self.keys) and self.keys[i].row == row:
-            self.keys[i].update(value, kind)
+        if i < len(block.rows) and block.rows[i] == row:
+            block.values[i] = value
+            block.kinds[i] = kind
         else:
-            self.keys.insert(i, TrackKey(row, value, kind))
+            block.rows.insert(i, row)
+            block.values.insert(i, value)
+            block.kinds.insert(i, kind)
+            if i == 0:
+                self._firsts[b] = row
+            self._cursor = -1
+            if self.compiled:
+                block.inv.insert(i, 0.0)
+                block.delta.insert(i, 0.0)
+                block.kernel.insert(i, STEP)
+
+        if self.compiled:
+            self._compile_segment(b, i - 1)
+            self._compile_segment(b, i)
+        if len(block.rows) >= 2 * self.block_size:
+            self._split_block(b)
+        self._edited()
 
     def delete(self, row):
-        """Delete a track value"""
-        i = self._get_key_index(row)
-        del self.keys[i]
+        """Delete the key at or before row"""
+        if not self._blocks or row < self._firsts[0]:
+            return
+
+        b = self._edit_block(row)
+        block = self._blocks[b]
+        i = bisect.bisect_right(block.rows, row) - 1
+        del block.rows[i]
+        del block.values[i]
+        del block.kinds[i]
+        self._cursor = -1
+        if self.compiled:
+            del block.inv[i]
+            del block.delta[i]
+            del block.kernel[i]
+
+        if len(block.rows) == 0:
+            del self._blocks[b]
+            del self._firsts[b]
+            # The previous key is the last key of the previous block
+            i = 0
+        elif i == 0:
+            self._firsts[b] = block.rows[0]
+
+        if self.compiled:
+            self._compile_segment(b, i - 1)
+        self._edited()
+
+    def _edit_block(self, row):
+        """
+        Index of the block to edit for a row.
+        Bulk loaded and read only keys are split into writable blocks first.
+        """
+        b = max(bisect.bisect_right(self._firsts, row) - 1, 0)
+        block = self._blocks[b]
+        if len(block.rows) < 2 * self.block_size and block.writable:
+            return b
+
+        self._split_block(b)
+        return max(bisect.bisect_right(self._firsts, row) - 1, 0)
+
+    def _split_block(self, b):
+        self._blocks[b:b + 1] = self._blocks[b].split(self.block_size)
+        self._firsts = array('i', [block.rows[0] for block in self._blocks])
+        self._cursor = -1
+
+    def _edited(self):
+        """Keys were edited in place"""
+        self._flat = None
+        self.baked = None
+        self.dirty = True
+        if self.container is not None:
+            self.container.version += 1
+
+    def apply_edits(self, edits):
+        """
+        Apply many key edits with one merge pass instead of an insert or delete per key.
+        Deleting a row without a key does nothing.
+        :param edits: Iterable of (row, value, kind) applied in order. A value of None deletes the key at row.
+        """
+        # The last edit of a row wins
+        ops = {}
+        for row, value, kind in edits:
+            ops[row] = (value, kind)
+        if not ops:
+            return
+
+        # A few edits are cheaper to apply in place
+        if len(ops) <= self.merge_threshold:
+            for row, (value, kind) in sorted(ops.items()):
+                if value is not None:
+                    self.add_or_update(row, value, kind)
+                elif self.has_key(row):
+                    self.delete(row)
+            return
+
+        updates = sorted((row, value, kind) for row, (value, kind) in ops.items() if value is not None)
+
+        numpy = import_numpy()
+        if numpy is not None:
+            rows = numpy.frombuffer(self.rows, dtype=numpy.int32)
+            edited = numpy.fromiter(ops.keys(), dtype=numpy.int64, count=len(ops))
+            # Drop existing keys at edited rows. Updated keys are inserted again below.
+            index = numpy.searchsorted(rows, edited)
+            found = index < len(rows)
+            found[found] = rows[index[found]] == edited[found]
+            keep = numpy.ones(len(rows), dtype=bool)
+            keep[index[found]] = False
+
+            new_rows = numpy.array([u[0] for u in updates], dtype=numpy.int32)
+            position = numpy.searchsorted(rows[keep], new_rows)
+            rows = numpy.insert(rows[keep], position, new_rows)
+            values = numpy.insert(numpy.frombuffer(self.values, dtype=numpy.float32)[keep], position,
+                                  numpy.array([u[1] for u in updates], dtype=numpy.float32))
+            kinds = numpy.insert(numpy.frombuffer(self.kinds, dtype=numpy.int8)[keep], position,
+                                 numpy.array([u[2] for u in updates], dtype=numpy.int8))
+            self.set_keys(array('i', rows.tobytes()), array('f', values.tobytes()), array('b', kinds.tobytes()))
+            return
+
+        # Merge the remaining keys with the sorted updates (timsort merges the two runs)
+        keys = [(r, v, k) for r, v, k in zip(self.rows, self.values, self.kinds) if r not in ops]
+        keys.extend(updates)
+        keys.sort(key=lambda key: key[0])
+        self.set_keys(
+            array('i', [key[0] for key in keys]),
+            array('f', [key[1] for key in keys]),
+            array('b', [key[2] for key in keys]),
+        )
+
+    def compile(self):
+        """
+        Build per segment tables (inverse length, value delta and kernel)
+        so row_value is a lookup plus a short polynomial.
+        Edits only recompile the neighbouring segments.
+        """
+        inv, delta, kernel = compile_segments(*self._keys())
+        self.compiled = True
+        if len(self._blocks) == 1:
+            block = self._blocks[0]
+            block.inv, block.delta, block.kernel = inv, delta, kernel
+            return
+
+        pos = 0
+        for block in self._blocks:
+            end = pos + len(block.rows)
+            block.inv, block.delta, block.kernel = inv[pos:end], delta[pos:end], kernel[pos:end]
+            pos = end
+
+    def _compile_segment(self, b, i):
+        """Update the segment starting at key i of block b. Index -1 is the last key of the previous block."""
+        if i < 0:
+            b -= 1
+            if b < 0:
+                return
+            i = len(self._blocks[b].rows) - 1
+
+        block = self._blocks[b]
+        rows = block.rows
+        if i + 1 < len(rows):
+            next_row, next_value = rows[i + 1], block.values[i + 1]
+        elif b + 1 < len(self._blocks):
+            following = self._blocks[b + 1]
+            next_row, next_value = following.rows[0], following.values[0]
+        else:
+            next_row = next_value = None
+
+        # The last key holds its value
+        if next_row is None or block.kinds[i] == STEP:
+            block.inv[i] = 0.0
+            block.delta[i] = 0.0
+            block.kernel[i] = STEP
+            return
+
+        kernel = block.kinds[i]
+        block.inv[i] = 1.0 / (next_row - rows[i])
+        block.delta[i] = next_value - block.values[i]
+        block.kernel[i] = kernel if kernel in (SMOOTH, RAMP) else LINEAR
+
+    def _keys_replaced(self):
+        """Key arrays were replaced or bulk loaded"""
+        self._firsts = array('i', [block.rows[0] for block in self._blocks])
+        self._flat = None
+        self._cursor = -1
+        self.baked = None
+        if self.compiled:
+            self.compile()
+        if self.container is not None:
+            self.container.version += 1
+
+    def bake(self, resolution=1):
+        """
+        Rasterize the track into a dense float32 table from the first to the last key.
+        Lookups become an index and a lerp. Entries in STEP segments are flagged
+        so lookups hold the value instead of blending into the next key.
+        Any key edit drops the table.
+        :param resolution: Table entries per row
+        """
+        numpy = import_numpy()
+        if not self._blocks:
+            self.baked = None
+            return
+
+        rows, kinds = self.rows, self.kinds
+        start = rows[0]
+        count = (rows[-1] - start) * resolution + 1
+        self.baked = None
+        if numpy is not None:
+            values = self.sample_rows(start + numpy.arange(count) / resolution)
+            table = array('f', values.astype(numpy.float32).tobytes())
+        else:
+            table = array('f', self.sample_rows(start + i / resolution for i in range(count)))
+
+        hold = array('b', bytes(count))
+        for k in range(len(rows) - 1):
+            if kinds[k] == STEP:
+                first = (rows[k] - start) * resolution
+                last = (rows[k + 1] - start) * resolution
+                hold[first:last] = array('b', [1]) * (last - first)
+        self.baked = (start, resolution, table, hold)
+        if self.container is not None:
+            self.container.version += 1
+
+    @staticmethod
+    def baked_size(rows, resolution):
+        """Size in bytes of a baked table spanning a number of rows"""
+        return (rows * resolution + 1) * 5
+
+    def keys_checksum(self):
+        """Checksum of the keys as stored in the track file"""
+        return zlib.crc32(encode_keys(self.rows, self.values, self.kinds))
+
+    def load_baked(self, filepath):
+        """
+        Load a baked lookup table.
+        Tables baked from other keys than the current ones are ignored.
+        :return: True if the table was loaded
+        """
+        with open(filepath, 'rb') as fd:
+            data = fd.read()
+        if data[:len(BAKE_MAGIC)] != BAKE_MAGIC or len(data) < BAKE_HEADER.size:
+            logger.warning("Ignoring baked track file with an unknown format: %s", filepath)
+            return False
+
+        _, start, resolution, count, num_keys, checksum = BAKE_HEADER.unpack_from(data)
+        if num_keys != len(self.rows) or checksum != self.keys_checksum():
+            logger.warning("Ignoring outdated baked track file: %s", filepath)
+            return False
+
+        if count < 0 or len(data) != BAKE_HEADER.size + count * 5:
+            logger.warning("Ignoring truncated baked track file: %s", filepath)
+            return False
+
+        table = array('f')
+        table.frombytes(data[BAKE_HEADER.size:BAKE_HEADER.size + count * 4])
+        hold = array('b', data[BAKE_HEADER.size + count * 4:])
+        if sys.byteorder == 'little':
+            table.byteswap()
+        self.baked = (start, resolution, table, hold)
+        return True
+
+    def save_baked(self, path):
+        """
+        Save the baked lookup table next to the track file.
+        The header records the keys the table was baked from.
+        """
+        start, resolution, table, hold = self.baked
+        data = array('f', table)
+        if sys.byteorder == 'little':
+            data.byteswap()
+        header = BAKE_HEADER.pack(BAKE_MAGIC, start, resolution, len(data), len(self.rows), self.keys_checksum())
+        atomic_write(os.path.join(path, Track.baked_filename(self.name)), header + data.tobytes() + hold.tobytes())
 
     def _get_key_index(self, row):
-        """Get the key that should be used as the first interpolation value"""
-        # Don't bother with empty tracks
-        if len(self.keys) == 0:
-            return -1
-
-        # No track values are defined yet
-        if row < self.keys[0].row:
-            return -1
-
-        # Get the insertion index
-        index = bisect.bisect_left(self.keys, row)
-        # Index is within the array size?
-        if index < len(self.keys):
-            # Are we inside an interval?
-            if row < self.keys[index].row:
-                return index - 1
-            return index
-
-        # Return the last index
-        return len(self.keys) - 1
+        """
+        Get the key that should be used as the first interpolation value.
+        The block of the key is stored in the cursor.
+        The cursor is only trusted if the row is inside the cursor's segment
+        or the one following it. Anything else (seeks, rewinds) falls back to bisect.
+        """
+        i = self._cursor
+        if i >= 0 and self.use_cursor:
+            rows = self._cursor_keys.rows
+            last = len(rows) - 1
+            if rows[i] <= row:
+                if i < last - 1:
+                    if row < rows[i + 1]:
+                        return i
+                    if row < rows[i + 2]:
+                        self._cursor = i + 1
+                        return i + 1
+                else:
+                    # The key after the last key of a block starts the next block
+                    b = self._cursor_block + 1
+                    end = self._firsts[b] if b < len(self._blocks) else None
+                    if i == last:
+                        if end is None or row < end:
+                            return i
+                    elif row < rows[i + 1]:
+                        return i
+                    elif end is None or row < end:
+                        self._cursor = i + 1
+                        return i + 1
+
+        b, i = self._find_key_index(row)
+        if i >= 0:
+            self._cursor_keys = self._blocks[b]
+        self._cursor_block = b
+        self._cursor = i
+        return i
+
+    def _find_key_index(self, row):
+        """
+        Get the key that should be used as the first interpolation value using bisect
+        :return: Tuple with the block and the index of the key in the block. The index is -1 before the first key.
+        """
+        firsts = self._firsts
+        # Don't bother with empty tracks and rows before the first key
+        if len(firsts) == 0 or row < firsts[0]:
+            return 0, -1
+
+        b = bisect.bisect_right(firsts, row) - 1
+        return b, bisect.bisect_right(self._blocks[b].rows, row) - 1
 
     @staticmethod
     def filename(name):
         """Create a valid file name from track name"""
         return "{}{}".format(name.replace(':', '#'), '.track')
 
+    @staticmethod
+    def baked_filename(name):
+        """Create a valid file name for a baked track"""
+        return "{}{}".format(name.replace(':', '#'), '.bake')
+
     @staticmethod
     def trackname(name):
         """Create track name from file name"""
@@ -148,18 +964,15 @@ class Track:
     def load(self, filepath):
         """Load the track file"""
         with open(filepath, 'rb') as fd:
-            num_keys = struct.unpack(">i", fd.read(4))[0]
-            for i in range(num_keys):
-                row, value, kind = struct.unpack('>ifb', fd.read(9))
-                self.keys.append(TrackKey(row, value, kind))
+            data = fd.read()
+        self.set_keys(*decode_keys(data, filepath))
+        self.dirty = False
 
     def save(self, path):
         """Save the track"""
         name = Track.filename(self.name)
-        with open(os.path.join(path, name), 'wb') as fd:
-            fd.write(struct.pack('>I', len(self.keys)))
-            for k in self.keys:
-                fd.write(struct.pack('>ifb', k.row, k.value, k.kind))
+        atomic_write(os.path.join(path, name), encode_keys(self.rows, self.values, self.kinds))
+        self.dirty = False
 
     def print_keys(self):
         for k in self.keys:
@@ -167,27 +980,32 @@ class Track:
 
 
 class TrackKey:
-    def __init__(self, row, value, kind):
-        self.row = row
-        self.value = value
-        self.kind = kind
+    """View of a single key in a track's key arrays"""
+    __slots__ = ('track', 'index')
+
+    def __init__(self, track, index):
+        self.track = track
+        self.index = index
+
+    @property
+    def row(self):
+        return self.track.rows[self.index]
+
+    @property
+    def value(self):
+        return self.track.values[self.index]
+
+    @property
+    def kind(self):
+        return self.track.kinds[self.index]
 
     def update(self, value, kind):
-        self.value = value
-        self.kind = kind
+        """Update the key through the track so segments, caches and the dirty flag follow"""
+        self.track.add_or_update(self.row, value, kind)
 
     @staticmethod
     def interpolate(first, second, row):
-        t = (row - first.row) / (second.row - first.row)
-
-        if first.kind == STEP:
-            return first.value
-        elif first.kind == SMOOTH:
-            t = t * t * (3 - 2 * t)
-        elif first.kind == RAMP:
-            t = math.pow(t, 2.0)
-
-        return first.value + (second.value - first.value) * t
+        return interpolate(first.kind, first.row, first.value, second.row, second.value, row)
 
     def __lt__(self, other):
         if isinstance(other, int):
@@ -203,3 +1021,183 @@ class TrackKey:
 
     def __repr__(self):
         return "TrackKey(row={} value={} type={})".format(self.row, self.value, self.kind)
+
+
+def atomic_write(filepath, data):
+    """Write a file through a temporary file and rename so it's never left half written"""
+    tmp = "{}.tmp{}".format(filepath, threading.get_ident())
+    try:
+        with open(tmp, 'wb') as fd:
+            fd.write(data)
+        os.replace(tmp, filepath)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_files(writes):
+    """
+    Atomically write files. A failed write doesn't stop the others.
+    :param writes: List of (filepath, data) tuples
+    :return: List of (index, exception) for failed writes
+    """
+    errors = []
+    for i, (filepath, data) in enumerate(writes):
+        try:
+            atomic_write(filepath, data)
+        except Exception as e:
+            errors.append((i, e))
+    return errors
+
+
+TRACK_HEADER = struct.Struct('>i')
+TRACK_KEY = struct.Struct('>ifb')
+# Baked tables: magic, start row, resolution, entries, number of keys and crc32 of the track file
+BAKE_MAGIC = b'RKBK'
+BAKE_HEADER = struct.Struct('>4siiiiI')
+
+# numpy dtype of a key in the track format
+TRACK_KEY_DTYPE = [('row', '>i4'), ('value', '>f4'), ('kind', 'i1')]
+
+
+def decode_keys(data, filepath=None):
+    """
+    Decode the content of a binary track file
+    :param data: The file content
+    :param filepath: File path used in error messages
+    :return: Tuple with rows, values and kinds arrays
+    """
+    numpy = import_numpy()
+    if len(data) < TRACK_HEADER.size:
+        raise ValueError("Truncated track file: {}".format(filepath))
+
+    count = TRACK_HEADER.unpack_from(data)[0]
+    if count < 0:
+        raise ValueError("Invalid key count {} in track file: {}".format(count, filepath))
+    end = TRACK_HEADER.size + count * TRACK_KEY.size
+    if len(data) < end:
+        raise ValueError("Truncated track file: {} (expected {} keys)".format(filepath, count))
+
+    payload = memoryview(data)[TRACK_HEADER.size:end]
+    if numpy is not None:
+        keys = numpy.frombuffer(payload, dtype=TRACK_KEY_DTYPE)
+        return (
+            array('i', keys['row'].astype(numpy.int32).tobytes()),
+            array('f', keys['value'].astype(numpy.float32).tobytes()),
+            array('b', keys['kind'].tobytes()),
+        )
+
+    # De-interleave the 9 byte records with strided slices
+    payload = bytes(payload)
+    rows, values = bytearray(count * 4), bytearray(count * 4)
+    for i in range(4):
+        rows[i::4] = payload[i::9]
+        values[i::4] = payload[4 + i::9]
+    rows, values, kinds = array('i', rows), array('f', values), array('b', payload[8::9])
+    if sys.byteorder == 'little':
+        rows.byteswap()
+        values.byteswap()
+    return rows, values, kinds
+
+
+def encode_keys(rows, values, kinds):
+    """
+    Encode keys into the binary track format
+    :return: bytes with the entire file content
+    """
+    numpy = import_numpy()
+    header = TRACK_HEADER.pack(len(rows))
+    if numpy is not None:
+        keys = numpy.empty(len(rows), dtype=TRACK_KEY_DTYPE)
+        keys['row'] = numpy.frombuffer(rows, dtype=numpy.int32)
+        keys['value'] = numpy.frombuffer(values, dtype=numpy.float32)
+        keys['kind'] = numpy.frombuffer(kinds, dtype=numpy.int8)
+        return header + keys.tobytes()
+
+    rows, values = array('i', rows), array('f', values)
+    if sys.byteorder == 'little':
+        rows.byteswap()
+        values.byteswap()
+    rows, values = rows.tobytes(), values.tobytes()
+    data = bytearray(len(header) + len(kinds) * TRACK_KEY.size)
+    data[:len(header)] = header
+    for i in range(4):
+        data[len(header) + i::9] = rows[i::4]
+        data[len(header) + 4 + i::9] = values[i::4]
+    data[len(header) + 8::9] = array('b', kinds).tobytes()
+    return bytes(data)
+
+
+def compile_segments(rows, values, kinds):
+    """
+    Segment tables of sorted keys. STEP keys and the last key hold their value.
+    :return: Tuple with inverse length and value delta float64 arrays and the kernel int8 array
+    """
+    numpy = import_numpy()
+    n = len(rows)
+    if numpy is not None and n > 0:
+        rows = numpy.frombuffer(rows, dtype=numpy.int32).astype(numpy.int64)
+        values = numpy.frombuffer(values, dtype=numpy.float32).astype(numpy.float64)
+        kinds = numpy.frombuffer(kinds, dtype=numpy.int8)
+        inv, delta, kernel = numpy.zeros(n), numpy.zeros(n), numpy.zeros(n, dtype=numpy.int8)
+        segment = numpy.flatnonzero(kinds[:-1] != STEP)
+        inv[segment] = 1.0 / (rows[segment + 1] - rows[segment])
+        delta[segment] = values[segment + 1] - values[segment]
+        kernel[segment] = numpy.where(numpy.isin(kinds[segment], (SMOOTH, RAMP)), kinds[segment], LINEAR)
+        return array('d', inv.tobytes()), array('d', delta.tobytes()), array('b', kernel.tobytes())
+
+    inv, delta, kernel = array('d', bytes(8 * n)), array('d', bytes(8 * n)), array('b', bytes(n))
+    for i in range(n - 1):
+        kind = kinds[i]
+        if kind != STEP:
+            inv[i] = 1.0 / (rows[i + 1] - rows[i])
+            delta[i] = values[i + 1] - values[i]
+            kernel[i] = kind if kind in (SMOOTH, RAMP) else LINEAR
+    return inv, delta, kernel
+
+
+def sort_keys(rows, values, kinds):
+    """
+    Sort key arrays by row. When rows are duplicated the last key wins.
+    :return: Tuple with sorted rows, values and kinds arrays
+    """
+    if all(rows[i] < rows[i + 1] for i in range(len(rows) - 1)):
+        return rows, values, kinds
+
+    # Stable sort on row so the last duplicate ends up last
+    order = sorted(range(len(rows)), key=rows.__getitem__)
+    keep = [i for n, i in enumerate(order) if n == len(order) - 1 or rows[order[n + 1]] != rows[i]]
+    return (
+        array('i', [rows[i] for i in keep]),
+        array('f', [values[i] for i in keep]),
+        array('b', [kinds[i] for i in keep]),
+    )
+
+
+def frame_count(start_row, end_row, step):
+    """Number of frames with a step of rows per frame in [start_row, end_row)"""
+    return max(0, math.ceil((end_row - start_row) / step))
+
+
+def frame_rows(start_row, step, first, last):
+    """
+    Rows of frames first to last (exclusive).
+    Rows are computed from the frame number so chunks evaluated separately line up exactly.
+    """
+    numpy = import_numpy()
+    return start_row + numpy.arange(first, last, dtype=numpy.float64) * step
+
+
+def interpolate(kind, first_row, first_value, second_row, second_value, row):
+    """Interpolate between two keys at a (fractional) row"""
+    t = (row - first_row) / (second_row - first_row)
+
+    if kind == STEP:
+        return first_value
+    elif kind == SMOOTH:
+        t = t * t * (3 - 2 * t)
+    elif kind == RAMP:
+        t = t * t
+
+    return first_value + (second_value - first_value) * t
@@ -14,13 +14,17 @@ setup(
     include_package_data=True,
     keywords=['synchronizing', 'music', 'rocket'],
     packages=['rocket'],
+    python_requires='>=3.7',
+    extras_require={
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Programming Language :: Python',
         'Intended Audience :: Developers',
         'Topic :: Multimedia :: Graphics',
         'License :: OSI Approved :: zlib/libpng License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries :: Application Frameworks',
     ],
 )